@@ -0,0 +1,16 @@
+from scripts.backtestUtils_2020 import *
+
+# ---------------------------------------------------------------------------------------------
+# -- Basic settings (see scripts/batchUtils_2020.py for the defaults, e.g. number of scenarios or alpha/beta)
+# ---------------------------------------------------------------------------------------------
+firstDay, lastDay = '2019-01-01', '2019-12-31' #historical prices are available for 2018-2019
+maxWorkers = None #one worker per core
+settings = {'useFactoredTree': True}
+
+#The guard is needed by the process pool on platforms that spawn the workers (Windows, macOS)
+if __name__ == '__main__':
+    table, throughput = runBacktest(firstDay, lastDay, settings, maxWorkers)
+    table.to_csv('data/backtest_'+firstDay+'_'+lastDay+'.csv')
+    print(table[['bid_MWh', 'wind_MWh', 'profit', 'perfect_information_profit', 'expected_profit']].to_string())
+    print(table[['DA_revenue', 'imbalance_revenue', 'profit']].sum().to_string())
+    print(throughput.to_string())
@@ -0,0 +1,14 @@
+from scripts.batchUtils_2020 import *
+
+# ---------------------------------------------------------------------------------------------
+# -- Basic settings (see scripts/batchUtils_2020.py for the defaults, e.g. number of scenarios or alpha/beta)
+# ---------------------------------------------------------------------------------------------
+firstDay, lastDay = '2019-01-01', '2019-12-31' #Change this to the range of days that need a bid
+maxWorkers = None #one worker per core
+settings = {'useFactoredTree': True}
+
+#The guard is needed by the process pool on platforms that spawn the workers (Windows, macOS)
+if __name__ == '__main__':
+    summary = runBatch(firstDay, lastDay, settings, maxWorkers)
+    summary.to_csv('data/batch_'+firstDay+'_'+lastDay+'.csv')
+    print(summary[['expected_profit', 'CVaR', 'VaR', 'status']].to_string())
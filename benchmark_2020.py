@@ -0,0 +1,49 @@
+import sys, argparse
+from scripts.benchmarkUtils_2020 import *
+
+# ---------------------------------------------------------------------------------------------
+# -- Benchmarks of the forecasting, scenario tree and optimization hot paths on synthetic inputs
+# ---------------------------------------------------------------------------------------------
+# python benchmark_2020.py                  full sweep, compared against the stored baseline
+# python benchmark_2020.py --quick          smaller sweep (only the cases it shares with the baseline are compared)
+# python benchmark_2020.py --save-baseline  stores this run as the new baseline
+# Timings depend on the machine: the stored baseline is only meaningful on the machine (and environment) that produced it.
+# When the number of cpus, the architecture or the python/numpy/pandas versions differ from the baseline, the comparison
+# is shown but no regression is reported. Otherwise the exit code is 1 when a case regressed, so the script can guard a CI job.
+baselineFileName = 'data/benchmarkBaseline_2020.json'
+outputFileName = 'data/benchmark_2020.json'
+repeat = 3 #every case is timed that many times, the fastest counts
+tolerance = 0.25 #a case regresses when it is more than 25% slower than the baseline
+solver = 'appsi_highs' #any open-source Pyomo solver, e.g. 'glpk' or 'cbc'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quick', action='store_true')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--repeat', type=int, default=repeat)
+    parser.add_argument('--tolerance', type=float, default=tolerance)
+    parser.add_argument('--solver', default=solver)
+    args = parser.parse_args()
+
+    results = runBenchmarks(quickSweeps if args.quick else sweeps, args.repeat, args.solver)
+    saveBenchmarks(results, outputFileName)
+    print('Results saved in: ', outputFileName)
+
+    if args.save_baseline:
+        saveBenchmarks(results, baselineFileName)
+        print('Baseline saved in: ', baselineFileName)
+        sys.exit(0)
+
+    baseline = loadBenchmarks(baselineFileName)
+    print('Baseline of', baseline['info']['date'], 'on', baseline['info']['platform'], '(', baseline['info']['cpus'], 'cpus )')
+    comparison = compareBenchmarks(results, baseline, args.tolerance)
+    print(comparison.to_string(float_format='{:.4f}'.format))
+
+    differences = machineDifferences(baseline)
+    if len(differences) > 0:
+        print('Not comparable with the baseline, different', ', '.join(differences), '(run with --save-baseline on this machine)')
+        sys.exit(0)
+
+    if comparison['regression'].any():
+        print('Regressions: ', ', '.join(comparison.index[comparison['regression']]))
+        sys.exit(1)
@@ -1,34 +1,43 @@
 from scripts.optimizationUtils.stochasticProgrammingModel import *
 from scripts.optimizationUtils.reportingUtils import *
 from scripts.optimizationUtils.plotUtils import *
+from scripts.generalUtils_2020 import loadScenarioTree, loadFactoredTree
+from scripts.instrumentationUtils_2020 import enableInstrumentation
 
 firstDateTest = '2020-02-10 00:00:00'  #TODO, in the jupyter it will be integrated
 folderName = firstDateTest.split(' ')[0]
+useFactoredTree = False #keeps wind and imbalance scenarios apart in the optimization model (same bid, smaller model)
+frontierAlphas, frontierBetas = [0.95], [] #e.g. numpy.linspace(0, 1, 11): efficient frontier re-solving the same model
+instrumentation = False #True: time and peak memory of every stage appended as JSON lines to stageLog.jsonl
 
 #--- Define basic I/O data
 fileDAP = 'data/'+str(folderName)+'/DAP_'+str(folderName)+'.csv'
-fileImNeg = 'data/'+str(folderName)+'/tree_imNeg_'+str(folderName)+'.csv'
-fileImPos = 'data/'+str(folderName)+'/tree_imPos_'+str(folderName)+'.csv'
-fileWind = 'data/'+str(folderName)+'/tree_wind_'+str(folderName)+'.csv'
-fileProbs = 'data/'+str(folderName)+'/tree_probs_'+str(folderName)+'.csv'
 
 outDir = 'data/'+str(folderName)+'/'
 reportFileName = outDir+'report_'+str(folderName)+'.xlsx'
 bidFileName = outDir+'bid_'+str(folderName)+'.csv'
 
+if instrumentation:
+    enableInstrumentation('stageLog.jsonl', run='main '+str(folderName))
+
 #--- Load data
 daP = pandas.read_csv(fileDAP, index_col=0)
-wind = pandas.read_csv(fileWind, index_col=0)
-rPlus = pandas.read_csv(fileImPos, index_col=0)
-rMinus = pandas.read_csv(fileImNeg, index_col=0)
-probs = pandas.read_csv(fileProbs, index_col=0)
+wind, rPlus, rMinus, probs = loadScenarioTree('data/', folderName) #binary tree file, or the csv files if there is none
 
 #Execute optimization model
-a, b = stochasticRisk(daP, wind, rPlus, rMinus, probs, 0.95, 0.1)
+if useFactoredTree:
+    a, b = stochasticRiskFactored(daP, loadFactoredTree('data/', folderName), 0.95, 0.1)
+else:
+    a, b = stochasticRisk(daP, wind, rPlus, rMinus, probs, 0.95, 0.1)
 
 displayReport(b)
 saveReport(b, reportFileName, bidFileName)
 
 plot_bid(b[1])
 plot_profit_distribution(b[2], b[0])
-plot_hourly_imbalance_dists(b[3], b[4], b[5])
\ No newline at end of file
+plot_hourly_imbalance_dists(b[3], b[4], b[5])
+
+if len(frontierBetas) > 0:
+    frontier = riskFrontier(a, frontierAlphas, frontierBetas)
+    print(frontier[['alpha', 'beta', 'expected_profit', 'CVaR', 'VaR']].to_string())
+    frontier.to_csv(outDir+'frontier_'+str(folderName)+'.csv')
\ No newline at end of file
@@ -0,0 +1,107 @@
+import os, time, json, hashlib, traceback, numpy, pandas
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scripts.forecastingUtils.foreCache_2020 import fileHash
+from scripts.forecastingUtils.foreStorage_2020 import updateColumnarStore
+from scripts.optimizationUtils.recourseUtils import scenarioProfits
+from scripts.batchUtils_2020 import defaultSettings, loadMarketData, loadSharedHistory, marketDay, realizedWind, windScenarios, optimizeBid
+
+# Rolling-origin backtest: every day of a range gets its bid from the data available before it (as in batchUtils_2020),
+# which is then settled against the realized wind power, day-ahead prices and imbalance price ratios of that day.
+# The wind scenarios and the bid of every day are cached on disk under a key made of the day, the settings of that
+# stage and the key of the stage before it, so a rerun only recomputes the stages whose settings changed.
+
+forecastSettings = ['inputFileName', 'periodsFuture', 'periodsPast', 'daysHistory', 'numScenarios', 'featureSelection', 'randomSeed', 'turbineRatedPower', 'windfarmRatedPower']
+bidSettings = ['priceFileName', 'ratioFileName', 'numReduced', 'useFactoredTree', 'alpha', 'beta', 'solver']
+backtestSettings = dict(defaultSettings, backtestCacheDir='data/backtestCache/')
+
+_settings = {} #settings of the current worker process
+
+def loadBacktestWorker(settings, market):
+    _settings.update(settings)
+    loadSharedHistory(settings, market)
+
+def stageKey(day, stage, fields, upstream=''):
+    values = [str(day), stage, upstream] + [_settings[field] for field in fields] + [_settings['inputHashes'].get(field) for field in fields]
+    return hashlib.sha1(json.dumps(values, default=str).encode()).hexdigest()
+
+def loadStage(stage, key):
+    path = os.path.join(_settings['backtestCacheDir'], stage+'_'+key+'.npz')
+    if not os.path.exists(path):
+        return None
+
+    with numpy.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+def saveStage(stage, key, **arrays):
+    os.makedirs(_settings['backtestCacheDir'], exist_ok=True)
+    path = os.path.join(_settings['backtestCacheDir'], stage+'_'+key+'.npz')
+    tmpPath = os.path.join(_settings['backtestCacheDir'], stage+'_'+key+'.'+str(os.getpid())+'.tmp.npz')
+    numpy.savez(tmpPath, **arrays)
+    os.replace(tmpPath, path) #atomic, concurrent runs never see half-written entries
+
+def settleBid(bid, market, actual):
+    # Realized profit of a bid: day-ahead revenue plus the imbalance settled at min(r,1) (surplus) or max(r,1) (shortfall) times the price
+    price, r = market['DAP'].values, market['r'].values
+    profit = scenarioProfits(bid, price, actual.reshape(1,-1), numpy.minimum(r, 1).reshape(1,-1), numpy.maximum(r, 1).reshape(1,-1))[0]
+    imbalance = actual - bid
+
+    return {'bid_MWh': bid.sum(), 'wind_MWh': actual.sum(), 'positive_imbalance_MWh': numpy.maximum(imbalance, 0).sum(), 'negative_imbalance_MWh': numpy.maximum(-imbalance, 0).sum(),
+            'DA_revenue': price @ bid, 'imbalance_revenue': profit - price @ bid, 'profit': profit, 'perfect_information_profit': price @ actual}
+
+def backtestDay(day):
+    computed = []
+
+    forecastKey = stageKey(day, 'forecast', forecastSettings)
+    forecast = loadStage('forecast', forecastKey)
+    if forecast is None:
+        forecast = {'wind': windScenarios(day, _settings).values}
+        saveStage('forecast', forecastKey, **forecast)
+        computed.append('forecast')
+
+    bidKey = stageKey(day, 'bid', bidSettings, forecastKey)
+    solution = loadStage('bid', bidKey)
+    if solution is None:
+        wind = pandas.DataFrame(data=forecast['wind'], index=['s'+str(s) for s in range(1, forecast['wind'].shape[0]+1)], columns=['t'+str(t) for t in range(1, 25)])
+        mainResults, bid = optimizeBid(marketDay(day)[['DAP']], wind, _settings)[:2]
+        solution = {'bid': bid.values.astype('float64'), 'expected': mainResults[['expected_profit', 'CVaR', 'VaR']].values.astype('float64')}
+        saveStage('bid', bidKey, **solution)
+        computed.append('bid')
+
+    row = {'expected_profit': solution['expected'][0], 'CVaR': solution['expected'][1], 'VaR': solution['expected'][2]}
+    row.update(settleBid(solution['bid'], marketDay(day), realizedWind(day, _settings)))
+    row['computed'] = '+'.join(computed) if computed else 'cached'
+    return row
+
+def _runDay(day):
+    # Errors are returned instead of raised so that one bad day does not stop the whole range
+    try:
+        return day, backtestDay(day), None
+    except Exception:
+        return day, None, traceback.format_exc()
+
+def runBacktest(firstDay, lastDay, settings=None, maxWorkers=None):
+    # Returns the daily profit/imbalance table and the throughput of the run
+    settings = dict(backtestSettings, **(settings or {}))
+    settings['inputHashes'] = {field: fileHash(settings['inputDataDir']+settings[field]) for field in ['inputFileName', 'priceFileName', 'ratioFileName']}
+    days = pandas.date_range(pandas.to_datetime(firstDay).normalize(), pandas.to_datetime(lastDay).normalize(), freq='D')
+    updateColumnarStore(settings['inputDataDir']+settings['inputFileName']) #the workers only read the columnar store
+
+    start = time.perf_counter()
+    rows = []
+    with ProcessPoolExecutor(max_workers=maxWorkers, initializer=loadBacktestWorker, initargs=(settings, loadMarketData(settings['inputDataDir']+settings['priceFileName']))) as executor:
+        futures = [executor.submit(_runDay, day) for day in days]
+        for future in as_completed(futures):
+            day, row, error = future.result()
+            if error is not None:
+                print('Failed day: ', day.strftime('%Y-%m-%d'))
+                print(error)
+                continue
+
+            rows.append(dict(row, day=day))
+    seconds = time.perf_counter() - start
+
+    table = pandas.DataFrame(rows).sort_values(by='day').set_index('day') if rows else pandas.DataFrame()
+    throughput = pandas.Series({'days': len(rows), 'failed_days': len(days) - len(rows), 'seconds': seconds, 'days_per_minute': 60*len(rows)/seconds})
+    print('Backtested', len(rows), 'days in', round(seconds, 1), 's:', round(throughput['days_per_minute'], 2), 'days per minute')
+
+    return table, throughput
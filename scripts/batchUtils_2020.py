@@ -0,0 +1,148 @@
+import traceback, numpy, pandas
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scripts.forecastingUtils.foreUtils_2020 import windowedDataSet, splitXY, feature_selection, createPredictionModel, forecastForwardBatch, powerG126
+from scripts.forecastingUtils.foreStorage_2020 import updateColumnarStore, loadColumnarSeries
+from scripts.forecastingUtils.foreCache_2020 import modelCacheKey, loadCachedModel, saveCachedModel
+from scripts.generalUtils_2020 import createDataDirectory, reduceScenarios, buildScenarioTree, buildFactoredTree, saveScenarioTree
+from scripts.optimizationUtils.stochasticProgrammingModel import stochasticRisk, stochasticRiskFactored
+from scripts.optimizationUtils.reportingUtils import saveReport
+
+# Multi-day version of windScenarioGenerator_2020.py + main.py: every day of a date range goes through
+# scenarios -> tree -> stochasticRisk -> saveReport in a process pool. Each worker loads the shared history
+# (wind speed series, day-ahead prices, imbalance ratio scenarios) once, and all day directories are created
+# by the parent process before the pool starts, so workers only ever write inside their own directory.
+
+defaultSettings = {'inputDataDir': 'data/', 'inputFileName': 'windSpeed_2020.csv', 'priceFileName': 'prices20182019_2020.xlsx',
+                   'ratioFileName': 'ratioScenarios_2020.csv', 'modelCacheDir': 'data/modelCache/',
+                   'turbineRatedPower': 2500, 'windfarmRatedPower': 25000,
+                   'periodsFuture': 144, 'periodsPast': 144*3, 'daysHistory': 30, 'numScenarios': 30, 'numReduced': None,
+                   'featureSelection': True, 'randomSeed': 10, 'alpha': 0.95, 'beta': 0.1,
+                   'useFactoredTree': False, 'solver': 'appsi_highs', 'solverOptions': {'threads': 1}}
+
+_shared = {} #history of the current worker process, filled by loadSharedHistory
+
+def loadMarketData(fileName):
+    # Hourly day-ahead prices and imbalance price ratios of the RATIOS_TOTAL sheet indexed by the start of the settlement period
+    prices = pandas.read_excel(fileName, sheet_name='RATIOS_TOTAL')
+    index = pandas.to_datetime(prices['Imbalance settlement period (CET)'].str[:16], format='%d.%m.%Y %H:%M')
+    return pandas.DataFrame(index=index, data={'DAP': prices['DAP'].values.astype('float64'), 'r': prices['r'].values.astype('float64')})
+
+def loadSharedHistory(settings, market=None):
+    # market: the loadMarketData frame if the parent already read it (the workbook is slow to parse).
+    # The columnar copy of the wind speeds is only read here: the parent brings it up to date before the pool starts
+    _shared['settings'] = settings
+    _shared['windSpeed'] = loadColumnarSeries(settings['inputDataDir']+settings['inputFileName'], update=False)
+    _shared['market'] = market if market is not None else loadMarketData(settings['inputDataDir']+settings['priceFileName'])
+    _shared['ratios'] = pandas.read_csv(settings['inputDataDir']+settings['ratioFileName'], index_col=0)
+
+def marketDay(day):
+    # Day-ahead prices and imbalance ratios of one day, indexed by t1..t24
+    market = _shared['market'].loc[day:day+pandas.Timedelta('23h')]
+    if len(market.index) != 24:
+        print('No day-ahead prices for: ', day.strftime('%Y-%m-%d'))
+        raise ValueError()
+
+    return market.set_axis(['t'+str(t) for t in range(1,25)])
+
+def dayAheadPrices(day, outputDir):
+    # The historical prices of the day are used as the price forecast and saved as DAP_<day>.csv, as read by main.py
+    dirName = day.strftime('%Y-%m-%d')
+    daP = marketDay(day)[['DAP']]
+    daP.to_csv(outputDir+'DAP_'+dirName+'.csv')
+    return daP
+
+def windScenarios(day, settings):
+    # The forecasting part of windScenarioGenerator_2020.py (without plots), on the history held by the worker
+    numpy.random.seed(settings['randomSeed']) #the same scenarios as a single-day run for this date, whatever the worker
+    firstDateTrain = day - pandas.Timedelta(str(settings['daysHistory'])+'D')
+    method = 'rfe_fast' if settings['featureSelection'] else 'none'
+
+    trainSet, testSet, trainIndex, testIndex, scaler = windowedDataSet(_shared['windSpeed'], firstDateTrain, day, settings['periodsPast'], settings['periodsFuture'])
+    trainX, trainY = splitXY(trainSet)
+    testX, testY = splitXY(testSet)
+
+    cacheKey = modelCacheKey(settings['inputDataDir']+settings['inputFileName'], firstDateTrain, settings['periodsPast'], settings['daysHistory'], method+'/LR', settings['randomSeed'])
+    cachedModel = loadCachedModel(settings['modelCacheDir'], cacheKey)
+    if cachedModel is None:
+        mask = feature_selection(trainX, trainY, method) if settings['featureSelection'] else None
+        model, res, stdevRes = createPredictionModel(trainX if mask is None else trainX[:,mask], trainY, method='LR')
+        saveCachedModel(settings['modelCacheDir'], cacheKey, mask, model, scaler, stdevRes)
+    else:
+        mask, model, scaler, stdevRes = cachedModel
+
+    arrayActual, scenarios = forecastForwardBatch(testX, model, scaler, settings['periodsFuture'], stdevRes, settings['numScenarios'], mask=mask, testY=testY, positivityRequirement=True, sampling='truncated')
+    scenarios = scaler.inverse_transform(scenarios.reshape(-1, 1)).reshape(scenarios.shape)
+
+    scenariosPower = powerG126(scenarios)*(settings['windfarmRatedPower']/settings['turbineRatedPower'])/1000
+    return pandas.DataFrame(data=scenariosPower, index=['s'+str(s) for s in range(1, settings['numScenarios']+1)], columns=['t'+str(t) for t in range(1, 25)])
+
+def realizedWind(day, settings):
+    # Wind farm power (MW) that was actually produced in each hour of the day, from the measured wind speeds
+    speed = _shared['windSpeed'].loc[day:day+pandas.Timedelta('1D')-pandas.Timedelta('1ns')]
+    if len(speed.index) != 144:
+        print('Incomplete wind speed measurements for: ', day.strftime('%Y-%m-%d'))
+        raise ValueError()
+
+    return powerG126(speed.values.reshape(1,-1))[0]*(settings['windfarmRatedPower']/settings['turbineRatedPower'])/1000
+
+def optimizeBid(daP, wind, settings, dirName=None):
+    # Scenario tree and risk-averse bid for one day's wind scenarios; the tree is saved in the day directory if dirName is given
+    windProb = pandas.Series(index=wind.index, data=1/len(wind.index))
+    if settings['numReduced'] is not None:
+        wind, windProb, distance = reduceScenarios(wind, windProb, settings['numReduced'])
+
+    if settings['useFactoredTree']:
+        model, resList = stochasticRiskFactored(daP, buildFactoredTree(wind, windProb, _shared['ratios']), settings['alpha'], settings['beta'], settings['solver'], settings['solverOptions'])
+    else:
+        windTree, imPos, imNeg, probs = buildScenarioTree(wind, windProb, _shared['ratios'])
+        if dirName is not None:
+            saveScenarioTree(settings['inputDataDir'], dirName, windTree, imPos, imNeg, probs)
+        model, resList = stochasticRisk(daP, windTree, imPos, imNeg, probs, settings['alpha'], settings['beta'], settings['solver'], settings['solverOptions'])
+
+    return resList
+
+def computeDayBid(day):
+    # Whole pipeline for one day; the outputs are the same files as windScenarioGenerator_2020.py and main.py
+    settings = _shared['settings']
+    dirName = day.strftime('%Y-%m-%d')
+    outputDir = settings['inputDataDir']+dirName+'/'
+
+    wind = windScenarios(day, settings)
+    wind.to_csv(outputDir+'wind_'+dirName+'.csv')
+    resList = optimizeBid(dayAheadPrices(day, outputDir), wind, settings, dirName)
+
+    saveReport(resList, outputDir+'report_'+dirName+'.xlsx', outputDir+'bid_'+dirName+'.csv')
+    return pandas.concat([resList[0], resList[6]]), resList[1] #main results with the solve status, time and iterations
+
+def _runDay(day):
+    # Errors are returned instead of raised so that one bad day does not stop the whole range
+    try:
+        mainResults, bid = computeDayBid(day)
+        return day, mainResults, bid, None
+    except Exception:
+        return day, None, None, traceback.format_exc()
+
+def runBatch(firstDay, lastDay, settings=None, maxWorkers=None):
+    # Bids for every day from firstDay to lastDay (both included); returns one row per day with the main results and the bid
+    settings = dict(defaultSettings, **(settings or {}))
+    days = pandas.date_range(pandas.to_datetime(firstDay).normalize(), pandas.to_datetime(lastDay).normalize(), freq='D')
+
+    for day in days: #done here once, the workers never create or remove directories
+        createDataDirectory(settings['inputDataDir'], day.strftime('%Y-%m-%d'))
+    updateColumnarStore(settings['inputDataDir']+settings['inputFileName']) #likewise, the workers never write the columnar store
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=maxWorkers, initializer=loadSharedHistory, initargs=(settings, loadMarketData(settings['inputDataDir']+settings['priceFileName']))) as executor:
+        futures = [executor.submit(_runDay, day) for day in days]
+        for future in as_completed(futures):
+            day, mainResults, bid, error = future.result()
+            if error is not None:
+                print('Failed day: ', day.strftime('%Y-%m-%d'))
+                print(error)
+                rows.append(pandas.Series({'day': day, 'status': 'error'}))
+                continue
+
+            print('Done day: ', day.strftime('%Y-%m-%d'))
+            rows.append(pandas.concat([pandas.Series({'day': day}), mainResults, bid]))
+
+    return pandas.DataFrame(rows).sort_values(by='day').set_index('day')
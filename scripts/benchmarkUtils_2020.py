@@ -0,0 +1,168 @@
+import os, io, json, time, shutil, tempfile, warnings, platform, contextlib, numpy, pandas
+from scripts.forecastingUtils.foreUtils_2020 import windowedDataSet, splitXY, feature_selection, createPredictionModel, forecastForward, forecastForwardBatch, powerG126
+from scripts.generalUtils_2020 import buildScenarioTree, generateScenarioTree
+from scripts.optimizationUtils.stochasticProgrammingModel import stochasticRisk
+
+# Benchmarks of the hot paths on synthetic inputs shaped like windSpeed_2020.csv (10-minute wind speeds) and
+# ratioScenarios_2020.csv (imbalance price ratio scenarios). Every case is identified by its benchmark name and
+# parameters, so a run can be compared case by case against a stored baseline of the same sweep.
+
+# Sweeps of the full suite; quickSweeps is a subset that runs in well under a minute
+sweeps = {'daysHistory': [30, 60], 'periodsPast': [144, 144*3], 'numScenarios': [30, 1000, 10000],
+          'loopScenarios': [10, 30], 'powerScenarios': [1000, 10000, 100000], 'treeWindScenarios': [30, 300], 'riskWindScenarios': [5, 10, 20]}
+quickSweeps = {'daysHistory': [30], 'periodsPast': [144*3], 'numScenarios': [30, 1000],
+               'loopScenarios': [10], 'powerScenarios': [1000, 10000], 'treeWindScenarios': [30], 'riskWindScenarios': [5]}
+
+def syntheticWindSpeed(days, seed=0, firstDate='2020-01-01'):
+    # 10-minute wind speeds (m/s): an AR(1) process around a daily cycle, clipped to the range of the measurements
+    rng = numpy.random.default_rng(seed)
+    periods = days*144
+    noise = rng.normal(0, 0.35, periods)
+    deviation = numpy.empty(periods)
+    deviation[0] = noise[0]
+    for t in range(1, periods):
+        deviation[t] = 0.98*deviation[t-1] + noise[t]
+
+    cycle = 1.5*numpy.sin(2*numpy.pi*numpy.arange(periods)/144)
+    index = pandas.date_range(firstDate, periods=periods, freq='10min', name='date')
+    return pandas.Series(index=index, data=numpy.clip(7 + cycle + 2*deviation, 0, 30).round(3), name='speed')
+
+def syntheticRatioScenarios(numRatios=20):
+    # Imbalance price ratios 0.1, 0.2, ... with bell-shaped probabilities around 1, as in ratioScenarios_2020.csv
+    r = numpy.round(0.1*numpy.arange(1, numRatios+1), 1)
+    prob = numpy.exp(-0.5*((r - 1.1)/0.25)**2) + 0.002
+    return pandas.DataFrame(index=['s'+str(s) for s in range(1, numRatios+1)], data={'prob': prob/prob.sum(), 'r': r})
+
+def syntheticPrices(seed=0):
+    # Day-ahead prices (Euros/MWh) of one day, indexed by t1..t24
+    rng = numpy.random.default_rng(seed)
+    prices = 45 + 12*numpy.sin(numpy.linspace(-numpy.pi/2, 3*numpy.pi/2, 24)) + rng.normal(0, 3, 24)
+    return pandas.DataFrame(index=['t'+str(t) for t in range(1, 25)], data={'DAP': prices.round(2)})
+
+def syntheticWindScenarios(numScenarios, seed=0):
+    # Hourly wind farm power scenarios (MW) between 0 and the 25 MW capacity, labelled s1, s2, ...
+    rng = numpy.random.default_rng(seed)
+    base = 12 + 8*numpy.sin(numpy.linspace(0, 3, 24))
+    power = numpy.clip(base + 0.5*rng.normal(0, 5, (numScenarios, 24)).cumsum(axis=1), 0, 25)
+    return pandas.DataFrame(index=['s'+str(s) for s in range(1, numScenarios+1)], columns=['t'+str(t) for t in range(1, 25)], data=power)
+
+def timeCall(function, repeat):
+    # Wall-clock seconds of every call (printing and warnings of the pipeline functions are discarded) and the result of the last call
+    times = []
+    for r in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            start = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - start)
+
+    return times, result
+
+def record(benchmark, params, times):
+    case = benchmark + '[' + ','.join(key+'='+str(value) for key, value in params.items()) + ']'
+    print('{:<70s} {:10.4f} s'.format(case, min(times)))
+    return dict(params, case=case, benchmark=benchmark, seconds=min(times), median=float(numpy.median(times)), repeat=len(times))
+
+def forecastInputs(speed, daysHistory, periodsPast, periodsFuture=144):
+    # Scaled lag matrices and a fitted model for the last day of the synthetic series, as in windScenarioGenerator_2020.py
+    firstDateTest = speed.index[-periodsFuture]
+    firstDateTrain = firstDateTest - pandas.Timedelta(str(daysHistory)+'D')
+    with contextlib.redirect_stdout(io.StringIO()):
+        trainSet, testSet, trainIndex, testIndex, scaler = windowedDataSet(speed, firstDateTrain, firstDateTest, periodsPast, periodsFuture)
+        trainX, trainY = splitXY(trainSet)
+        testX, testY = splitXY(testSet)
+        mask = feature_selection(trainX, trainY, 'rfe_fast')
+        model, res, stdevRes = createPredictionModel(trainX[:, mask], trainY, method='LR')
+
+    return {'trainX': trainX, 'trainY': trainY, 'testX': testX, 'testY': testY, 'testIndex': testIndex, 'scaler': scaler,
+            'mask': mask, 'model': model, 'stdev': stdevRes, 'firstDateTrain': firstDateTrain, 'firstDateTest': firstDateTest}
+
+def runBenchmarks(sweeps=sweeps, repeat=3, solver='appsi_highs', seed=0):
+    # Runs every case of the sweeps (each timed repeat times, the fastest counts); returns one record per case
+    periodsFuture = 144
+    speed = syntheticWindSpeed(max(sweeps['daysHistory']) + 4, seed) #the lag warm-up of up to 3 days and the test day
+    ratios = syntheticRatioScenarios()
+    results = []
+
+    for daysHistory in sweeps['daysHistory']:
+        for periodsPast in sweeps['periodsPast']:
+            params = {'daysHistory': daysHistory, 'periodsPast': periodsPast}
+            inputs = forecastInputs(speed, daysHistory, periodsPast, periodsFuture)
+
+            #scaling, lag matrix (createLagMatrix) and train/test split of the history held in memory, as the pipeline does
+            times, dataSet = timeCall(lambda: windowedDataSet(speed, inputs['firstDateTrain'], inputs['firstDateTest'], periodsPast, periodsFuture), repeat)
+            results.append(record('windowedDataSet', params, times))
+
+            times, mask = timeCall(lambda: feature_selection(inputs['trainX'], inputs['trainY'], 'rfe_fast'), repeat)
+            results.append(record('feature_selection', params, times))
+
+    inputs = forecastInputs(speed, sweeps['daysHistory'][0], max(sweeps['periodsPast']), periodsFuture)
+    testSet = pandas.DataFrame(index=inputs['testIndex'])
+    forecastArgs = (inputs['testX'], inputs['model'], inputs['scaler'], periodsFuture, inputs['stdev'])
+    for numScenarios in sweeps['loopScenarios']: #one call per scenario, as in the original notebook loop
+        def loop():
+            numpy.random.seed(seed)
+            return [forecastForward(testSet, *forecastArgs, mask=inputs['mask'], testY=inputs['testY'], sampling='truncated') for s in range(numScenarios)]
+        times, paths = timeCall(loop, repeat)
+        results.append(record('forecastForward', {'numScenarios': numScenarios, 'periodsPast': max(sweeps['periodsPast'])}, times))
+
+    for numScenarios in sweeps['numScenarios']:
+        def batch():
+            numpy.random.seed(seed)
+            return forecastForwardBatch(*forecastArgs, numScenarios, mask=inputs['mask'], testY=inputs['testY'], sampling='truncated')
+        times, paths = timeCall(batch, repeat)
+        results.append(record('forecastForwardBatch', {'numScenarios': numScenarios, 'periodsPast': max(sweeps['periodsPast'])}, times))
+
+    for numScenarios in sweeps['powerScenarios']:
+        scenarios = numpy.random.default_rng(seed).uniform(0, 30, (numScenarios, periodsFuture))
+        times, power = timeCall(lambda: powerG126(scenarios), repeat)
+        results.append(record('powerG126', {'numScenarios': numScenarios}, times))
+
+    #generateScenarioTree reads the ratio scenarios and the wind scenarios of the day from disk
+    workDir = tempfile.mkdtemp(prefix='benchmark_') + '/'
+    ratios.to_csv(workDir+'ratioScenarios_2020.csv')
+    for numWind in sweeps['treeWindScenarios']:
+        dirName = 'tree'+str(numWind)
+        os.mkdir(workDir+dirName)
+        syntheticWindScenarios(numWind, seed).to_csv(workDir+dirName+'/wind_'+dirName+'.csv')
+        times, tree = timeCall(lambda: generateScenarioTree(workDir, dirName), repeat)
+        results.append(record('generateScenarioTree', {'treeSize': numWind*len(ratios.index)}, times))
+    shutil.rmtree(workDir)
+
+    daP = syntheticPrices(seed)
+    for numWind in sweeps['riskWindScenarios']:
+        wind = syntheticWindScenarios(numWind, seed)
+        windTree, imPos, imNeg, probs = buildScenarioTree(wind, pandas.Series(index=wind.index, data=1/numWind), ratios)
+        times, (model, resList) = timeCall(lambda: stochasticRisk(daP, windTree, imPos, imNeg, probs, 0.95, 0.1, solver), repeat)
+        results.append(record('stochasticRisk', {'treeSize': len(windTree.index), 'solver': solver}, times))
+
+    return results
+
+def benchmarkInfo():
+    # What the timings depend on besides the code: compare baselines only between runs on the same machine
+    return {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(), 'numpy': numpy.__version__,
+            'pandas': pandas.__version__, 'platform': platform.platform(), 'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+def saveBenchmarks(results, fileName):
+    with open(fileName, 'w') as f:
+        json.dump({'info': benchmarkInfo(), 'results': results}, f, indent=1)
+
+def loadBenchmarks(fileName):
+    with open(fileName) as f:
+        return json.load(f)
+
+def machineDifferences(baseline):
+    # Keys of benchmarkInfo that differ from the baseline and make its timings incomparable (e.g. another number of cpus)
+    current = benchmarkInfo()
+    return [key for key in ['cpus', 'machine', 'python', 'numpy', 'pandas'] if baseline['info'].get(key) != current[key]]
+
+def compareBenchmarks(results, baseline, tolerance=0.25, minSeconds=0.005):
+    # One row per case of the current run: a case regresses when it is more than tolerance slower than the baseline
+    # and by more than minSeconds (differences of a few milliseconds are timer noise). Cases missing from the baseline have no ratio.
+    current = pandas.DataFrame(results).set_index('case')['seconds']
+    reference = pandas.DataFrame(baseline['results']).set_index('case')['seconds'] if baseline['results'] else pandas.Series(dtype='float64')
+
+    table = pandas.DataFrame({'seconds': current, 'baseline': reference.reindex(current.index)})
+    table['ratio'] = table['seconds'] / table['baseline']
+    table['regression'] = (table['ratio'] > 1 + tolerance) & (table['seconds'] - table['baseline'] > minSeconds)
+    return table
@@ -0,0 +1,79 @@
+import os, hashlib, numpy, pandas
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.preprocessing import StandardScaler
+
+# On-disk cache of the fitting stage (feature mask, linear model, scaler and residual stdev).
+# Every entry is one .npz file named after its key; the modification time is used as the last access time.
+
+def fileHash(fileName, blockSize=2**20):
+    digest = hashlib.sha1()
+    with open(fileName, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+def modelCacheKey(fileName, firstDateTrain, periodsPast, daysHistory, method, seed):
+    fields = [fileHash(fileName), str(pandas.to_datetime(firstDateTrain)), str(periodsPast), str(daysHistory), str(method), str(seed)]
+    return hashlib.sha1('|'.join(fields).encode()).hexdigest()
+
+def saveCachedModel(cacheDir, key, mask, model, scaler, stdevRes, maxEntries=100, maxBytes=50*2**20):
+    if not isinstance(model, (LinearRegression, Ridge)):
+        print('Only linear models can be cached! Skipping the cache.')
+        return
+
+    os.makedirs(cacheDir, exist_ok=True)
+    path = os.path.join(cacheDir, key+'.npz')
+    tmpPath = os.path.join(cacheDir, key+'.'+str(os.getpid())+'.tmp.npz')
+
+    numpy.savez(tmpPath,
+                hasMask=type(mask) != type(None), mask=numpy.asarray(mask if type(mask) != type(None) else []),
+                modelClass=type(model).__name__, coef=model.coef_, intercept=numpy.asarray(model.intercept_),
+                scalerMean=scaler.mean_, scalerScale=scaler.scale_, scalerVar=scaler.var_, scalerSamples=numpy.asarray(scaler.n_samples_seen_),
+                stdevRes=stdevRes)
+    os.replace(tmpPath, path) #atomic, concurrent runs never see half-written entries
+
+    evictCache(cacheDir, maxEntries, maxBytes)
+
+def loadCachedModel(cacheDir, key):
+    path = os.path.join(cacheDir, key+'.npz')
+    if not os.path.exists(path):
+        return None
+
+    with numpy.load(path) as data:
+        mask = data['mask'] if data['hasMask'] else None
+
+        model = {'LinearRegression': LinearRegression, 'Ridge': Ridge}[str(data['modelClass'])]()
+        model.coef_, model.intercept_ = data['coef'], data['intercept']
+        model.n_features_in_ = data['coef'].shape[-1]
+
+        scaler = StandardScaler()
+        scaler.mean_, scaler.scale_, scaler.var_ = data['scalerMean'], data['scalerScale'], data['scalerVar']
+        scaler.n_samples_seen_, scaler.n_features_in_ = data['scalerSamples'], data['scalerMean'].shape[0]
+
+        stdevRes = float(data['stdevRes'])
+
+    os.utime(path) #mark as recently used
+    print('Loaded cached prediction model: ', path)
+    return mask, model, scaler, stdevRes
+
+def evictCache(cacheDir, maxEntries=100, maxBytes=50*2**20):
+    # Least recently used entries are removed first until both the entry and the size limit hold
+    entries = []
+    for f in os.listdir(cacheDir):
+        if f.endswith('.npz') and not f.endswith('.tmp.npz'):
+            try:
+                stat = os.stat(os.path.join(cacheDir, f))
+            except OSError: #removed by a concurrent run
+                continue
+            entries.append((stat.st_mtime, stat.st_size, os.path.join(cacheDir, f)))
+    entries.sort(reverse=True)
+
+    totalBytes = 0
+    for count, (mtime, size, path) in enumerate(entries):
+        totalBytes += size
+        if count >= maxEntries or totalBytes > maxBytes:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,191 @@
+import os, io, json, time, hashlib, numpy, pandas
+from ..instrumentationUtils_2020 import instrumented
+
+def parseDates(values):
+    # Files written by pandas are ISO (year first), raw platform exports are day first
+    values = pandas.Index(values).astype(str)
+    isoFormat = len(values) > 0 and values[0][:4].isdigit() and values[0][4:5] == '-'
+    return pandas.DatetimeIndex(pandas.to_datetime(values, dayfirst=not isoFormat))
+
+@instrumented()
+def readSeriesWindow(fileName, firstDate, lastDate, column='speed'):
+    # Reads only the rows between firstDate and lastDate (inclusive) of a date-sorted csv, by bisecting on byte offsets
+    firstDate, lastDate = pandas.to_datetime(firstDate), pandas.to_datetime(lastDate)
+
+    with open(fileName, 'rb') as f:
+        header = f.readline()
+        dataStart = f.tell()
+        fileEnd = f.seek(0, 2)
+
+        def lineStart(offset): #start of the first line at or after offset
+            if offset <= dataStart:
+                return dataStart
+            f.seek(offset - 1)
+            f.readline()
+            return f.tell()
+
+        def dateAt(start):
+            f.seek(start)
+            line = f.readline().decode().strip()
+            return parseDates([line.split(',')[0]])[0] if line else None
+
+        def firstLineNotBefore(date, strict=False):
+            low, high = dataStart, fileEnd
+            while low < high:
+                mid = (low + high) // 2
+                stamp = dateAt(lineStart(mid))
+                if stamp is None or stamp > date or (stamp == date and not strict):
+                    high = mid
+                else:
+                    low = mid + 1
+            return lineStart(low)
+
+        begin, end = firstLineNotBefore(firstDate), firstLineNotBefore(lastDate, strict=True)
+        f.seek(begin)
+        chunk = f.read(max(end - begin, 0))
+
+    window = pandas.read_csv(io.BytesIO(header + chunk), index_col=0)
+    window.index = parseDates(window.index)
+    print('Read', len(window.index), 'rows from', fileName)
+    return window[column]
+
+# Columnar binary copy of a (date, value) csv: int64 epoch (ns), value array and validity bitmap as raw files
+# that are memory-mapped on load. The csv is converted once; rows appended to it later are parsed incrementally.
+# An update never touches the files in use: it writes a new generation of files under a unique name and then
+# atomically replaces meta.json, which names the current generation. Readers (and a concurrent writer) therefore
+# always see one complete generation; superseded files are removed once they are no longer recent.
+
+def columnarDir(fileName):
+    return os.path.splitext(fileName)[0] + '_columnar'
+
+def prefixHash(fileName, numBytes, blockSize=2**20):
+    digest = hashlib.sha1()
+    with open(fileName, 'rb') as f:
+        while numBytes > 0:
+            block = f.read(min(blockSize, numBytes))
+            if not block:
+                break
+            digest.update(block)
+            numBytes -= len(block)
+
+    return digest.hexdigest()
+
+def parseColumnarRows(fileName, start, column):
+    with open(fileName, 'rb') as f:
+        header = f.readline()
+        f.seek(max(start, f.tell()))
+        chunk = f.read()
+
+    rows = pandas.read_csv(io.BytesIO(header + chunk), index_col=0)
+    index = parseDates(rows.index)
+    epoch = index.values.astype('datetime64[ns]').view('int64')
+    return epoch, rows[column].values, rows.index.name
+
+def columnarFiles(storeDir, generation):
+    return {name: os.path.join(storeDir, name.replace('.', '_'+generation+'.')) for name in ['epoch.i8', 'values.bin', 'valid.bits']}
+
+def readColumnarMeta(storeDir):
+    metaFile = os.path.join(storeDir, 'meta.json')
+    if not os.path.exists(metaFile):
+        return None
+
+    with open(metaFile) as f:
+        return json.load(f)
+
+def removeOldGenerations(storeDir, generation, minAge=600):
+    # Files of other generations are kept for minAge seconds, for readers that opened meta.json just before the update
+    current = set(os.path.basename(path) for path in columnarFiles(storeDir, generation).values())
+    for name in os.listdir(storeDir):
+        path = os.path.join(storeDir, name)
+        if name.endswith(('.i8', '.bin', '.bits')) and name not in current and time.time() - os.path.getmtime(path) > minAge:
+            try:
+                os.remove(path)
+            except OSError: #still memory-mapped by a reader on Windows
+                pass
+
+def updateColumnarStore(fileName, column='speed', dtype='float64'):
+    # Brings the columnar copy up to date with the csv. In a process pool, call it once in the parent and let the
+    # workers read with update=False (see loadColumnarSeries), so the csv is not parsed by every worker.
+    # dtype='float32' halves the files but rounds the values (about 7 significant digits).
+    storeDir = columnarDir(fileName)
+    stat = os.stat(fileName)
+
+    meta = readColumnarMeta(storeDir)
+    if meta is not None and (meta['column'] != column or meta['dtype'] != dtype or 'generation' not in meta):
+        meta = None
+
+    if meta != None and meta['sourceBytes'] == stat.st_size and meta['sourceMtime'] == stat.st_mtime:
+        return storeDir, meta
+
+    append = meta != None and stat.st_size > meta['sourceBytes'] and prefixHash(fileName, meta['sourceBytes']) == meta['prefixHash']
+
+    if append:
+        epoch, values, indexName = parseColumnarRows(fileName, meta['sourceBytes'], column)
+        print('Appending', epoch.shape[0], 'new rows to the columnar copy of', fileName)
+    else:
+        os.makedirs(storeDir, exist_ok=True)
+        epoch, values, indexName = parseColumnarRows(fileName, 0, column)
+        meta = {'rows': 0, 'column': column, 'dtype': dtype, 'indexName': indexName}
+        print('Converting', fileName, 'to columnar format')
+
+    values = values.astype(dtype)
+    valid = (~numpy.isnan(values)).astype('uint8')
+    if append: #the new generation starts with the rows of the current one
+        epoch, values, valid = (numpy.concatenate([old, new]) for old, new in zip(readColumnarArrays(storeDir, meta)[:3], [epoch, values, valid]))
+
+    generation = '%d_%d_%s' % (time.time_ns(), os.getpid(), os.urandom(4).hex())
+    files = columnarFiles(storeDir, generation)
+    epoch.astype('int64').tofile(files['epoch.i8'])
+    values.astype(dtype).tofile(files['values.bin'])
+    numpy.packbits(valid.astype('uint8')).tofile(files['valid.bits'])
+
+    meta = dict(meta, rows=int(epoch.shape[0]), generation=generation, sourceBytes=stat.st_size, sourceMtime=stat.st_mtime,
+                prefixHash=prefixHash(fileName, stat.st_size))
+    metaFile = os.path.join(storeDir, 'meta.json')
+    with open(metaFile + '.' + generation, 'w') as f:
+        json.dump(meta, f)
+    os.replace(metaFile + '.' + generation, metaFile)
+
+    removeOldGenerations(storeDir, generation)
+    return storeDir, meta
+
+def readColumnarArrays(storeDir, meta):
+    # Memory-mapped epoch and values and the validity flags of the generation named in meta
+    if meta['rows'] == 0:
+        return numpy.zeros(0, dtype='int64'), numpy.zeros(0, dtype=meta['dtype']), numpy.zeros(0, dtype=bool), meta
+
+    files = columnarFiles(storeDir, meta['generation'])
+    epoch = numpy.memmap(files['epoch.i8'], dtype='int64', mode='r', shape=(meta['rows'],))
+    values = numpy.memmap(files['values.bin'], dtype=meta['dtype'], mode='r', shape=(meta['rows'],))
+    valid = numpy.unpackbits(numpy.fromfile(files['valid.bits'], dtype='uint8'))[:meta['rows']].astype(bool)
+    return epoch, values, valid, meta
+
+def openColumnarStore(fileName, column='speed', dtype='float64', update=True):
+    # update=False only reads the current generation (the store must exist), it never writes
+    if update:
+        storeDir, meta = updateColumnarStore(fileName, column, dtype)
+    else:
+        storeDir, meta = columnarDir(fileName), readColumnarMeta(columnarDir(fileName))
+        if meta is None or meta['column'] != column or meta['dtype'] != dtype or 'generation' not in meta:
+            print('No up-to-date columnar copy of', fileName, '(run updateColumnarStore first)')
+            raise ValueError()
+
+    return readColumnarArrays(storeDir, meta)
+
+@instrumented()
+def loadColumnarSeries(fileName, firstDate=None, lastDate=None, column='speed', dtype='float64', update=True):
+    # Rows between firstDate and lastDate (inclusive); only that slice of the memory-mapped arrays is read
+    epoch, values, valid, meta = openColumnarStore(fileName, column, dtype, update)
+
+    begin, end = 0, epoch.shape[0]
+    if firstDate is not None:
+        begin = epoch.searchsorted(pandas.to_datetime(firstDate).to_datetime64().astype('datetime64[ns]').astype('int64'), 'left')
+    if lastDate is not None:
+        end = epoch.searchsorted(pandas.to_datetime(lastDate).to_datetime64().astype('datetime64[ns]').astype('int64'), 'right')
+    end = max(begin, end)
+
+    index = pandas.DatetimeIndex(numpy.array(epoch[begin:end]).astype('datetime64[ns]'), name=meta['indexName'])
+    data = numpy.where(valid[begin:end], numpy.array(values[begin:end], dtype='float64'), numpy.nan)
+
+    print('Read', end - begin, 'rows from the columnar copy of', fileName)
+    return pandas.Series(index=index, data=data, name=column)
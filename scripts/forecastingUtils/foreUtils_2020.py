@@ -1,32 +1,55 @@
-import pandas, numpy
+import os, pandas, numpy
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.linear_model import LinearRegression, Ridge
 from sklearn.feature_selection import RFE, mutual_info_regression
-
+from sklearn.preprocessing import StandardScaler
+from scipy.special import ndtr, ndtri
+from numpy.lib.stride_tricks import sliding_window_view
+from .foreStorage_2020 import parseDates, readSeriesWindow, loadColumnarSeries
+from ..instrumentationUtils_2020 import instrumented, addStageFields
+try:
+    from numba import njit
+except ImportError: #optional, without it the AR recursion runs as one numpy step over all scenarios per period
+    njit = None
+
+G126_RATED_POWER = 2500 #kW
+G126_CUT_IN, G126_RATED_SPEED, G126_DERATE_SPEED, G126_CUT_OUT = 2, 10, 21, 25 #m/s
+G126_RAMP_UP = [-7.1754, 120.13, -252.4, 186.36] #cubic coefficients between cut-in and rated speed
+G126_RAMP_DOWN = [9.3333, -654.31, 15059, -111619] #cubic coefficients between derating and cut-out speed
+
+def powerCurveG126(speed):
+    # Works on whole arrays (a single series or a scenarios x periods matrix) and keeps the input shape
+    speed = numpy.asarray(speed, dtype='float64')
+
+    if numpy.isnan(speed).any():
+        print('Invalid wind speed at position(s): ', numpy.argwhere(numpy.isnan(speed))[:5].tolist())
+        raise ValueError
+
+    conditions = [(speed >= G126_CUT_IN) & (speed < G126_RATED_SPEED),
+                  (speed >= G126_RATED_SPEED) & (speed <= G126_DERATE_SPEED),
+                  (speed > G126_DERATE_SPEED) & (speed <= G126_CUT_OUT)]
+    choices = [numpy.polyval(G126_RAMP_UP, speed), G126_RATED_POWER, numpy.polyval(G126_RAMP_DOWN, speed)]
+
+    return numpy.select(conditions, choices, default=0.0)
+
+def hourlyMean(values, periodsPerHour=6):
+    # Averages consecutive periods along the last axis; a trailing incomplete hour is averaged on its own
+    values = numpy.asarray(values, dtype='float64')
+    periods = values.shape[-1]
+    fullPeriods = periods - periods % periodsPerHour
+
+    hourly = values[..., :fullPeriods].reshape(values.shape[:-1] + (-1, periodsPerHour)).mean(axis=-1)
+    if fullPeriods < periods:
+        hourly = numpy.concatenate([hourly, values[..., fullPeriods:].mean(axis=-1, keepdims=True)], axis=-1)
+
+    return hourly
+
+@instrumented()
 def powerG126(speed):
-    power = numpy.zeros(speed.shape)
-    powerH = numpy.zeros((speed.shape[0], int(speed.shape[1]/6)))
-
-    for s in range(power.shape[0]):
-        for t in range(power.shape[1]):
-            if speed[s,t] < 2 or speed[s,t]>25:
-                power[s,t] = 0
-            elif speed[s,t] >=2 and speed[s,t] < 10:
-                power[s,t] = -7.1754 * (speed[s,t] ** 3) + 120.13* (speed[s,t] ** 2)- 252.4* speed[s,t]+ 186.36
-            elif speed[s,t] >=10 and speed[s,t] <=21:
-                power[s,t] = 2500
-            elif speed[s,t] >21 and speed[s,t] <=25:
-                power[s, t] = 9.3333 * (speed[s, t] ** 3) - 654.31 * (speed[s, t] ** 2) + 15059 * speed[s, t] -111619
-            else:
-                print(t, s, speed[s,t])
-                raise ValueError
-
-    #Dates here are artificial in order to resample the dataframe
-    powerDf = pandas.DataFrame(index=['s'+str(s) for s in range(1,power.shape[0]+1)], columns=pandas.date_range('2015-01-01 00:00', periods=power.shape[1], freq='10min'), data=power)
-    powerH = powerDf.T.resample('H').mean().T
-
-    return powerH.values
+    return hourlyMean(powerCurveG126(speed))
 
+@instrumented()
 def createDataSet(dfIn, periodsPast):
     dfOut = pandas.DataFrame()
 
@@ -43,6 +66,24 @@ def createDataSet(dfIn, periodsPast):
     print('Dataset created!')
     return dfOut[dfOut.columns[::-1]]
 
+def createLagMatrix(dfIn, periodsPast):
+    # Read-only strided view over the series: row i holds t_periodsPast ... t_1, t for the timestamp lagIndex[i]
+    values = numpy.ascontiguousarray(dfIn.values, dtype='float64')
+    lagMatrix = sliding_window_view(values, periodsPast+1)
+    lagIndex = dfIn.index[periodsPast:]
+
+    # Windows containing NaN are found on the series itself. If there are any, the remaining rows are copied into a regular
+    # (rows x periodsPast+1) float64 array, so a single gap costs the full matrix in memory; windowedDataSet keeps that
+    # to the training and test windows by slicing the series first. Without gaps the result stays a zero-copy view.
+    nanCount = numpy.concatenate([[0], numpy.cumsum(numpy.isnan(values))])
+    valid = (nanCount[periodsPast+1:] - nanCount[:-periodsPast-1]) == 0
+    if not valid.all():
+        print('Discarding', (~valid).sum(), 'rows with NaN values')
+        lagMatrix, lagIndex = lagMatrix[valid], lagIndex[valid]
+
+    print('Lag matrix created!')
+    return lagMatrix, lagIndex
+
 def discardNaN(df):
     original_first_period = df.index[0]
     df.dropna(axis=0, inplace= True)
@@ -58,13 +99,84 @@ def splitTrainTest(df, firstDateTrain, firstDateTest, value, unit):
     print('Dataset was split in train and test set!')
     return dfTrain, dfTest
 
+def splitTrainTestLag(lagMatrix, lagIndex, firstDateTrain, firstDateTest, value, unit):
+    # Same windows as splitTrainTest, taken as row slices (views) of the lag matrix
+    lastDateTrain = pandas.to_datetime(firstDateTest)-pandas.Timedelta(value=value, unit=unit)
+    trainRows = slice(lagIndex.searchsorted(pandas.to_datetime(firstDateTrain), 'left'), lagIndex.searchsorted(lastDateTrain, 'right'))
+    testRows = slice(lagIndex.searchsorted(pandas.to_datetime(firstDateTest), 'left'), len(lagIndex))
+
+    print('Dataset was split in train and test set!')
+    return lagMatrix[trainRows], lagMatrix[testRows], lagIndex[trainRows], lagIndex[testRows]
+
+@instrumented()
+def createWindowedDataSet(fileName, firstDateTrain, firstDateTest, periodsPast, periodsFuture, value=10, unit='min', columnar=True):
+    # Reads, scales and lags only the training window, the test window and the lag warm-up before them
+    step = pandas.Timedelta(value=value, unit=unit)
+    firstDateTrain, firstDateTest = pandas.to_datetime(firstDateTrain), pandas.to_datetime(firstDateTest)
+    if columnar:
+        series = loadColumnarSeries(fileName, firstDateTrain - periodsPast*step, firstDateTest + (periodsFuture-1)*step)
+    else:
+        series = readSeriesWindow(fileName, firstDateTrain - periodsPast*step, firstDateTest + (periodsFuture-1)*step)
+
+    return windowedDataSet(series, firstDateTrain, firstDateTest, periodsPast, periodsFuture, value, unit)
+
+@instrumented()
+def windowedDataSet(series, firstDateTrain, firstDateTest, periodsPast, periodsFuture, value=10, unit='min'):
+    # Same as createWindowedDataSet on a series already in memory (e.g. the whole history loaded once by a batch worker)
+    step = pandas.Timedelta(value=value, unit=unit)
+    firstDateTrain, firstDateTest = pandas.to_datetime(firstDateTrain), pandas.to_datetime(firstDateTest)
+    series = series.loc[firstDateTrain - periodsPast*step:firstDateTest + (periodsFuture-1)*step].astype('float64')
+
+    # The scaler only sees the history, not the day to be predicted
+    scaler = StandardScaler()
+    scaler.fit(series.loc[:firstDateTest - step].values.reshape(-1,1))
+    series.loc[:] = scaler.transform(series.values.reshape(-1,1))[:,0]
+
+    lagMatrix, lagIndex = createLagMatrix(series, periodsPast)
+    trainSet, testSet, trainIndex, testIndex = splitTrainTestLag(lagMatrix, lagIndex, firstDateTrain, firstDateTest, value, unit)
+
+    return trainSet, testSet, trainIndex, testIndex, scaler
+
 def splitXY(df):
 
-    X = df.values[:, :-1]
-    Y = df.values[:, -1].reshape(-1,1)
+    X = numpy.asarray(df)[:, :-1]
+    Y = numpy.asarray(df)[:, -1].reshape(-1,1)
 
     return X, Y
 
+def rfeLinear(trainX, trainY, numFeatures=6*5, step=50, maxCondition=1e10):
+    # Same elimination as RFE(LinearRegression(fit_intercept=True)): drop the features with the smallest squared coefficients.
+    # X'X and X'y are formed once on centred data and the inverse is downdated as features are removed. That only matches
+    # sklearn (which solves by least squares) when X'X is well-conditioned; a short history (rows <= lags) makes it singular,
+    # and then sklearn's RFE is used instead.
+    X = numpy.asarray(trainX, dtype='float64')
+    y = numpy.ravel(trainY).astype('float64')
+    Xc = X - X.mean(axis=0)
+    gram = Xc.T @ Xc
+    if X.shape[0] <= X.shape[1] or numpy.linalg.cond(gram) > maxCondition:
+        print('Ill-conditioned training matrix', X.shape, ', using sklearn RFE for the feature selection')
+        return RFE(LinearRegression(fit_intercept=True), n_features_to_select=numFeatures, step=step).fit(X, y).support_
+
+    gramInv = numpy.linalg.inv(gram)
+    cross = Xc.T @ (y - y.mean())
+
+    features = numpy.arange(X.shape[1])
+    while features.shape[0] > numFeatures:
+        coef = gramInv @ cross[features]
+        ranks = numpy.argsort(coef**2, kind='stable')
+        threshold = min(step, features.shape[0] - numFeatures)
+
+        drop = numpy.zeros(features.shape[0], dtype=bool)
+        drop[ranks[:threshold]] = True
+        keep = ~drop
+        gramInv = gramInv[numpy.ix_(keep, keep)] - gramInv[numpy.ix_(keep, drop)] @ numpy.linalg.solve(gramInv[numpy.ix_(drop, drop)], gramInv[numpy.ix_(drop, keep)])
+        features = features[keep]
+
+    support = numpy.zeros(X.shape[1], dtype=bool)
+    support[features] = True
+    return support
+
+@instrumented()
 def feature_selection(trainX, trainY, method='rfe'):
 
     if method == 'mutual_info':
@@ -78,11 +190,15 @@ def feature_selection(trainX, trainY, method='rfe'):
 
     if method == 'rfe':
         estimator = LinearRegression(fit_intercept=True)
-        selector = RFE(estimator, 6*5, 50, verbose=2).fit(trainX, trainY)
+        selector = RFE(estimator, n_features_to_select=6*5, step=50, verbose=2).fit(trainX, trainY)
         mask = selector.support_
 
+    if method == 'rfe_fast':
+        mask = rfeLinear(trainX, trainY, 6*5, 50)
+
     return mask
 
+@instrumented()
 def createPredictionModel(trainX, trainY, method = 'LR'):
     print('Creating base prediction model')
 
@@ -103,10 +219,28 @@ def createPredictionModel(trainX, trainY, method = 'LR'):
 
     return model, res, stdevRes
 
-def forecastForward(testSet, testX, model, scaler, periodsFuture, stdev, mask = None, testY = None, positivityRequirement=True):
+def scaledThreshold(scaler, value=0):
+    # A threshold of the original series expressed once in the scaled space
+    return float(scaler.transform(numpy.array([[value]]))[0, 0])
+
+def truncatedNormalNoise(lowerBound, stdev, u):
+    # Inverse-CDF draw from N(0, stdev) truncated to noise >= lowerBound, with u uniform in (0, 1].
+    # Sampling through the upper tail keeps it accurate far away from the mean.
+    tail = ndtr(-numpy.asarray(lowerBound) / stdev)
+    noise = -stdev * ndtri(u * tail)
+    return numpy.where(tail > 0, numpy.maximum(noise, lowerBound), lowerBound)
+
+@instrumented()
+def forecastForward(testSet, testX, model, scaler, periodsFuture, stdev, mask = None, testY = None, positivityRequirement=True, sampling='rejection'):
 
     list_actual, list_predicted = [], []
 
+    if sampling not in ['rejection', 'truncated']:
+        print('Unknown sampling mode!')
+        raise ValueError()
+
+    zeroScaled = scaledThreshold(scaler)
+
     for t_in, t in enumerate(testSet.index):
 
         if type(testY) != type(None):
@@ -118,14 +252,18 @@ def forecastForward(testSet, testX, model, scaler, periodsFuture, stdev, mask =
                 x = x[:,mask]
 
         else:
-            x = testX[t_in, :].reshape((1, -1))
+            x = testX[t_in, :].reshape((1, -1)).copy()
             for el_in, el in enumerate(list_predicted):
                 x[:, -len(list_predicted) + el_in] = el
 
             if type(mask) != type(None):
                 x = x[:,mask]
 
-        if positivityRequirement == True:
+        if positivityRequirement == True and sampling == 'truncated':
+            basePrediction = model.predict(x)
+            y_hat = basePrediction + truncatedNormalNoise(zeroScaled - basePrediction, stdev, 1 - numpy.random.uniform(0, 1, 1))
+
+        elif positivityRequirement == True:
             basePrediction = model.predict(x)
 
             y_hat = basePrediction + numpy.random.normal(0, stdev, 1)
@@ -139,11 +277,198 @@ def forecastForward(testSet, testX, model, scaler, periodsFuture, stdev, mask =
             y_hat = model.predict(x) + numpy.random.normal(0, stdev, 1)
 
         if type(testY) != type(None):
-            list_actual.append(float(y_actual))
+            list_actual.append(numpy.ravel(y_actual)[0].item())
 
-        list_predicted.append(float(y_hat))
+        list_predicted.append(numpy.ravel(y_hat)[0].item())
 
         if t_in == periodsFuture - 1:
             break
 
-    return numpy.asanyarray(list_actual), numpy.asanyarray(list_predicted)
\ No newline at end of file
+    return numpy.asanyarray(list_actual), numpy.asanyarray(list_predicted)
+
+def batchPredictor(model):
+    # Linear models are applied directly as a matrix product, anything else goes through predict
+    if isinstance(model, (LinearRegression, Ridge)):
+        coef = numpy.ravel(model.coef_)
+        intercept = float(numpy.ravel(model.intercept_)[0]) if numpy.size(model.intercept_) > 0 else 0.0
+        return lambda x: x @ coef + intercept
+
+    return lambda x: numpy.ravel(model.predict(x))
+
+@instrumented()
+def forecastForwardBatch(testX, model, scaler, periodsFuture, stdev, numScenarios, mask = None, testY = None, positivityRequirement=True, sampling='rejection', rng=numpy.random):
+    # Simulates all scenario paths together: one prediction per step for the whole (scenarios x lags) state.
+    # rng is the source of the random numbers: the global numpy.random state by default, or a numpy.random.Generator
+    predict = batchPredictor(model)
+    periodsFuture = min(periodsFuture, testX.shape[0])
+    addStageFields(scenarios=numScenarios, periods=periodsFuture)
+    numLags = testX.shape[1]
+
+    lagCols = numpy.arange(numLags)
+    if type(mask) != type(None):
+        lagCols = lagCols[mask]
+    lagBack = numLags - lagCols #how many periods back each (selected) lag looks
+
+    if sampling not in ['rejection', 'truncated']:
+        print('Unknown sampling mode!')
+        raise ValueError()
+
+    predicted = numpy.zeros((numScenarios, periodsFuture))
+    truncated = positivityRequirement == True and sampling == 'truncated'
+    if truncated:
+        # Fixed cost per step: every draw lands above the (scaled) zero threshold
+        zeroScaled = scaledThreshold(scaler)
+        uniforms = 1 - rng.uniform(0, 1, (numScenarios, periodsFuture))
+    else:
+        noise = rng.normal(0, stdev, (numScenarios, periodsFuture))
+
+    for t in range(periodsFuture):
+        fromPredicted = lagBack <= t
+        x = numpy.empty((numScenarios, lagCols.shape[0]))
+        x[:, ~fromPredicted] = testX[t, lagCols[~fromPredicted]]
+        x[:, fromPredicted] = predicted[:, t - lagBack[fromPredicted]]
+
+        basePrediction = predict(x)
+
+        if truncated:
+            y_hat = basePrediction + truncatedNormalNoise(zeroScaled - basePrediction, stdev, uniforms[:, t])
+
+        elif positivityRequirement == True:
+            y_hat = basePrediction + noise[:, t]
+            rejected = scaler.inverse_transform(y_hat.reshape(-1, 1))[:, 0] < 0
+            while rejected.any():
+                y_hat[rejected] = basePrediction[rejected] + rng.normal(0, stdev, rejected.sum())
+                rejected = scaler.inverse_transform(y_hat.reshape(-1, 1))[:, 0] < 0
+
+        else:
+            y_hat = basePrediction + noise[:, t]
+
+        predicted[:, t] = y_hat
+
+    if type(testY) != type(None):
+        actual = numpy.ravel(testY)[:periodsFuture].astype('float64')
+    else:
+        actual = numpy.asanyarray([])
+
+    return actual, predicted
+
+def forecastForwardChunks(testX, model, scaler, periodsFuture, stdev, numScenarios, chunkSize=10000, mask = None, positivityRequirement=True, sampling='rejection', rng=numpy.random):
+    # Generator version of forecastForwardBatch: yields the (scaled) scenarios in blocks of at most chunkSize paths, so only
+    # one block is ever in memory. With sampling='truncated' the random numbers are drawn in the same order as one big batch.
+    for start in range(0, numScenarios, chunkSize):
+        actual, predicted = forecastForwardBatch(testX, model, scaler, periodsFuture, stdev, min(chunkSize, numScenarios - start), mask=mask, positivityRequirement=positivityRequirement, sampling=sampling, rng=rng)
+        yield predicted
+
+def linearAR(model, numLags, mask = None):
+    # Compact form of a fitted LinearRegression/Ridge model: how many periods back each selected lag looks, and its coefficient
+    lagCols = numpy.arange(numLags)
+    if type(mask) != type(None):
+        lagCols = lagCols[mask]
+    intercept = float(numpy.ravel(model.intercept_)[0]) if numpy.size(model.intercept_) > 0 else 0.0
+
+    return (numLags - lagCols).astype('int64'), numpy.ravel(model.coef_).astype('float64'), intercept
+
+def arRecursionLoop(path, numHistory, lagBack, coef, intercept):
+    for s in range(path.shape[0]):
+        for t in range(numHistory, path.shape[1]):
+            value = intercept
+            for j in range(lagBack.shape[0]):
+                value += coef[j] * path[s, t - lagBack[j]]
+            path[s, t] += value
+
+arRecursionCompiled = njit(cache=True)(arRecursionLoop) if njit is not None else None
+
+def arRecursion(path, numHistory, lagBack, coef, intercept):
+    # path is (scenarios x (numHistory + periods)): the history first, then the noise of every period, which is replaced in
+    # place by the simulated values
+    if arRecursionCompiled is not None:
+        arRecursionCompiled(path, numHistory, lagBack, coef, intercept)
+        return path
+
+    for t in range(numHistory, path.shape[1]):
+        path[:, t] += intercept + path[:, t - lagBack] @ coef
+
+    return path
+
+def forecastMeanPath(testX, model, periodsFuture, mask = None):
+    # Noise-free forecast of the linear AR model (the mean, and median, of the untruncated scenarios) in scaled units
+    periodsFuture = min(periodsFuture, testX.shape[0])
+    numLags = testX.shape[1]
+    lagBack, coef, intercept = linearAR(model, numLags, mask)
+
+    path = numpy.zeros((1, numLags + periodsFuture))
+    path[0, :numLags] = testX[0] #lag column j is the value numLags-j periods before the first forecast
+    return arRecursion(path, numLags, lagBack, coef, intercept)[0, numLags:]
+
+def forecastVariance(model, numLags, periodsFuture, stdev, mask = None):
+    # Analytic variance of the h-step forecast, stdev^2 * sum(psi_k^2, k < h), with the psi weights of the AR model obtained as
+    # its response to a single unit shock
+    lagBack, coef, intercept = linearAR(model, numLags, mask)
+
+    impulse = numpy.zeros((1, numLags + periodsFuture))
+    impulse[0, numLags] = 1
+    psi = arRecursion(impulse, numLags, lagBack, coef, 0.0)[0, numLags:]
+
+    return stdev**2 * numpy.cumsum(psi**2)
+
+def forecastQuantiles(testX, model, scaler, periodsFuture, stdev, quantiles=(0.05, 0.5, 0.95), mask = None):
+    # Mean path and quantile bands of the wind speed without any sampling, in m/s. The positivity truncation of the scenarios
+    # is not modelled; bands are only cut at zero.
+    mean = forecastMeanPath(testX, model, periodsFuture, mask)
+    std = numpy.sqrt(forecastVariance(model, testX.shape[1], mean.shape[0], stdev, mask))
+
+    bands = pandas.DataFrame(index=range(mean.shape[0]), data={'mean': mean, 'stdev': std})
+    for q in quantiles:
+        bands[q] = mean + std*ndtri(q)
+
+    speeds = scaler.inverse_transform(bands.drop(columns='stdev').values.reshape(-1, 1)).reshape(mean.shape[0], -1)
+    bands.loc[:, bands.columns != 'stdev'] = numpy.maximum(speeds, 0)
+    bands['stdev'] = std * scaler.scale_[0]
+
+    return bands
+
+@instrumented()
+def forecastForwardAR(testX, model, periodsFuture, stdev, numScenarios, mask = None, testY = None, rng=numpy.random):
+    # Scenarios of the linear AR model with plain Gaussian noise (no positivity requirement), simulated on the compact
+    # lag-index form; same draws and paths as forecastForwardBatch(..., positivityRequirement=False)
+    periodsFuture = min(periodsFuture, testX.shape[0])
+    numLags = testX.shape[1]
+    lagBack, coef, intercept = linearAR(model, numLags, mask)
+
+    path = numpy.empty((numScenarios, numLags + periodsFuture))
+    path[:, :numLags] = testX[0]
+    path[:, numLags:] = rng.normal(0, stdev, (numScenarios, periodsFuture))
+    predicted = arRecursion(path, numLags, lagBack, coef, intercept)[:, numLags:]
+
+    if type(testY) != type(None):
+        actual = numpy.ravel(testY)[:periodsFuture].astype('float64')
+    else:
+        actual = numpy.asanyarray([])
+
+    return actual, predicted
+
+def forecastScenarioBlock(testX, model, scaler, periodsFuture, stdev, numScenarios, mask, positivityRequirement, sampling, seed):
+    return forecastForwardBatch(testX, model, scaler, periodsFuture, stdev, numScenarios, mask=mask, positivityRequirement=positivityRequirement, sampling=sampling, rng=numpy.random.default_rng(seed))[1]
+
+@instrumented()
+def forecastForwardParallel(testX, model, scaler, periodsFuture, stdev, numScenarios, seed, mask = None, testY = None, positivityRequirement=True, sampling='rejection', blockSize=1000, maxWorkers=None, executor='process'):
+    # Scenarios are simulated in fixed blocks of blockSize paths, block k drawing from its own Generator spawned from
+    # SeedSequence(seed). The blocks do not depend on the number of workers, so the output is bit-identical for a given
+    # seed however many workers (processes or threads) share the work. executor='thread' avoids copying the inputs, but the
+    # per-period loop is Python and small numpy steps that hold the GIL, so threads scale little beyond one core; use
+    # 'process' for multi-core speed-ups. Process pools need the caller's script to be importable without side effects
+    # on Windows/macOS (if __name__ == '__main__').
+    blocks = [min(blockSize, numScenarios - start) for start in range(0, numScenarios, blockSize)]
+    seeds = numpy.random.SeedSequence(seed).spawn(len(blocks))
+    maxWorkers = maxWorkers or os.cpu_count()
+
+    with (ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor)(max_workers=min(maxWorkers, len(blocks))) as pool:
+        futures = [pool.submit(forecastScenarioBlock, testX, model, scaler, periodsFuture, stdev, size, mask, positivityRequirement, sampling, blockSeed) for size, blockSeed in zip(blocks, seeds)]
+        predicted = numpy.concatenate([future.result() for future in futures])
+
+    if type(testY) != type(None):
+        actual = numpy.ravel(testY)[:min(periodsFuture, testX.shape[0])].astype('float64')
+    else:
+        actual = numpy.asanyarray([])
+
+    return actual, predicted
@@ -0,0 +1,97 @@
+import os, sys, json, time, functools, threading, pandas
+try:
+    import resource
+except ImportError: #not available on Windows
+    resource = None
+
+# Stage-level instrumentation: every instrumented function (or 'with stage(...)' block) writes one JSON line with its
+# duration, the peak resident memory of the process so far and any extra fields (scenario counts, Pyomo build/solve time).
+# It is off by default; when off, an instrumented call costs one dictionary lookup.
+# The switch, file and run label are shared by all threads; the stack of open stages is per thread (a stage run in a
+# worker thread has no parent), and records are appended to the file under a lock.
+
+_state = {'enabled': False, 'fileName': None, 'run': None}
+_local = threading.local()
+_writeLock = threading.Lock()
+
+def openStages():
+    # Stages entered and not yet left by the current thread, innermost last
+    if not hasattr(_local, 'open'):
+        _local.open = []
+    return _local.open
+
+def enableInstrumentation(fileName='stageLog.jsonl', run=None):
+    # Records are appended to fileName (by default next to LOG.txt when run from the repo root); run labels this run's records
+    _state.update(enabled=True, fileName=fileName, run=run if run is not None else time.strftime('%Y-%m-%d %H:%M:%S'))
+    openStages().clear()
+
+def disableInstrumentation():
+    _state['enabled'] = False
+
+def peakMemoryMB():
+    # Peak resident set size of the process in MB, None where it cannot be measured
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10 #bytes on macOS, kB on Linux
+
+    try:
+        import psutil
+    except ImportError:
+        return None
+
+    info = psutil.Process().memory_info()
+    return getattr(info, 'peak_wset', info.rss) / 2**20
+
+def addStageFields(**fields):
+    # Extra fields for the innermost open stage (ignored when instrumentation is off or no stage is open)
+    if _state['enabled'] and openStages():
+        openStages()[-1].update(fields)
+
+class stage:
+    # with stage('name', field=value): ... records the block as one stage
+    def __init__(self, name, **fields):
+        self.name, self.fields = name, fields
+
+    def __enter__(self):
+        if _state['enabled']:
+            stages = openStages()
+            self.record = dict(self.fields, stage=self.name, parent=stages[-1]['stage'] if stages else None)
+            stages.append(self.record)
+            self.start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        record, stages = getattr(self, 'record', None), openStages()
+        if record is None or not stages or stages[-1] is not record: #entered while instrumentation was off
+            return False
+
+        stages.pop()
+        record.update(run=_state['run'], pid=os.getpid(), thread=threading.current_thread().name, seconds=time.perf_counter() - self.start,
+                      peak_rss_mb=peakMemoryMB(), failed=excType is not None)
+        line = json.dumps(record, default=str) + '\n'
+        with _writeLock, open(_state['fileName'], 'a') as f:
+            f.write(line)
+
+        return False
+
+def instrumented(name=None):
+    # Decorator: every call of the function is a stage named after it
+    def decorator(function):
+        stageName = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _state['enabled']:
+                return function(*args, **kwargs)
+
+            with stage(stageName):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+def loadStageLog(fileName='stageLog.jsonl'):
+    # The records as a DataFrame, e.g. loadStageLog().groupby('stage')['seconds'].sum()
+    return pandas.read_json(fileName, lines=True)
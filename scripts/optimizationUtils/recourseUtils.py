@@ -0,0 +1,67 @@
+import numpy, pandas
+from .stochasticProgrammingModel import profitDistribution
+
+# Closed-form second stage of the bidding problem: for a day-ahead bid P_DA the imbalance of every scenario is
+# Delta = P_W_DA - P_DA, paid at dplus*price when positive and charged at dminus*price when negative. With
+# dplus <= 1 <= dminus splitting Delta into both a positive and a negative part never pays, so this is the LP recourse.
+# Scenario arrays are (scenarios x periods), bids are (periods,) or (bids x periods).
+
+def scenarioProfits(bid, price, wind, dplus, dminus, chunkSize=10000):
+    # Profit of every scenario for a bid (scenarios,), or for a batch of bids (bids x scenarios)
+    bids = numpy.atleast_2d(numpy.asarray(bid, dtype='float64'))
+    profit = numpy.empty((bids.shape[0], wind.shape[0]))
+    step = max(1, chunkSize // bids.shape[0]) #bounds the (bids x chunk x periods) temporaries
+
+    for start in range(0, wind.shape[0], step):
+        chunk = slice(start, start+step)
+        delta = wind[None, chunk] - bids[:, None, :]
+        value = bids[:, None, :] + dplus[None, chunk]*numpy.maximum(delta, 0) - dminus[None, chunk]*numpy.maximum(-delta, 0)
+        profit[:, chunk] = value @ price
+
+    return profit[0] if numpy.ndim(bid) == 1 else profit
+
+def profitGradients(bid, price, wind, dplus, dminus, weights, chunkSize=10000):
+    # Weighted sum over scenarios of the profit supergradients with respect to the bid, one value per period
+    gradient = numpy.zeros(wind.shape[1])
+
+    for start in range(0, wind.shape[0], chunkSize):
+        chunk = slice(start, start+chunkSize)
+        modifier = numpy.where(bid[None, :] < wind[chunk], dplus[chunk], dminus[chunk])
+        gradient += weights[chunk] @ (1 - modifier)
+
+    return gradient * price
+
+def cvarWeights(profit, prob, alpha):
+    # Weights of the (1-alpha) worst profits: CVaR = weights @ profit, VaR = profit of the scenario where the tail ends.
+    # profit is (scenarios,) or (bids x scenarios); CVaR and VaR then have one value per bid
+    order = numpy.argsort(profit, axis=-1, kind='stable')
+    sortedProb = prob[order]
+    tail = 1 - alpha
+    before = numpy.cumsum(sortedProb, axis=-1) - sortedProb
+
+    weights = numpy.empty(profit.shape)
+    numpy.put_along_axis(weights, order, numpy.clip(tail - before, 0, sortedProb) / tail, axis=-1)
+    last = (before < tail).sum(axis=-1, keepdims=True) - 1
+    var = numpy.take_along_axis(numpy.take_along_axis(profit, order, axis=-1), last, axis=-1)[..., 0][()]
+
+    return weights, (weights*profit).sum(axis=-1), var
+
+def evaluateBids(bids, DApriceFC, WGScen, IMplus, IMminus, probs, alpha, chunkSize=10000):
+    # Scores bids without solving anything. bids is one bid (a Series over the periods, e.g. resList[1] of stochasticRisk)
+    # or a DataFrame with one candidate bid per row. Returns the scenario profits (a resDist-like frame for a single bid,
+    # bids x scenarios otherwise) and expected_profit, CVaR and VaR at alpha as in mainResults.
+    periods, scenarios = list(DApriceFC.index), list(WGScen.index)
+    price = DApriceFC['DAP'].values.astype('float64')
+    wind = WGScen.loc[:, periods].values.astype('float64')
+    dplus, dminus = IMplus.loc[scenarios, periods].values.astype('float64'), IMminus.loc[scenarios, periods].values.astype('float64')
+    prob = probs.loc[scenarios, 'prob'].values.astype('float64')
+
+    profit = scenarioProfits(bids[periods].values if isinstance(bids, pandas.DataFrame) else bids.loc[periods].values, price, wind, dplus, dminus, chunkSize)
+    weights, cvar, var = cvarWeights(profit, prob, alpha)
+    expectedProfit = profit @ prob
+
+    if isinstance(bids, pandas.DataFrame):
+        measures = pandas.DataFrame(index=bids.index, data={'alpha': alpha, 'expected_profit': expectedProfit, 'CVaR': cvar, 'VaR': var})
+        return pandas.DataFrame(index=bids.index, columns=scenarios, data=profit), measures
+
+    return profitDistribution(scenarios, profit, prob), pandas.Series(index=['alpha', 'expected_profit', 'CVaR', 'VaR'], data=[alpha, expectedProfit, cvar, var])
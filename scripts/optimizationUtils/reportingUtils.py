@@ -1,11 +1,15 @@
 import pandas
+from ..instrumentationUtils_2020 import instrumented
 
 def displayReport(resList):
     print('Solution report')
     print(resList[0].to_string())
+    if len(resList) > 6: #solver status, time and iterations
+        print(resList[6].to_string())
     print('---------------------------------------------------')
 
 
+@instrumented()
 def saveReport(resList, reportFileName, bidFileName):
     with pandas.ExcelWriter(reportFileName) as writer:
         resList[0].to_excel(writer, sheet_name='Main_results')
@@ -13,5 +17,7 @@ def saveReport(resList, reportFileName, bidFileName):
         resList[2].to_excel(writer, sheet_name='Profit-distribution')
         resList[3].to_excel(writer, sheet_name='Imbalance_volumes')
         resList[4].to_excel(writer, sheet_name='Expected_hourly_imbalance')
+        if len(resList) > 6:
+            resList[6].to_excel(writer, sheet_name='Solve_info')
 
     resList[1].to_csv(bidFileName, header=False)
\ No newline at end of file
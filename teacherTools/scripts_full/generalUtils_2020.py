@@ -1,4 +1,9 @@
-import os, shutil, pandas
+import os, shutil, collections, numpy, pandas
+from .instrumentationUtils_2020 import instrumented, addStageFields
+
+# Factored scenario tree: wind and imbalance ratio scenarios are kept apart with their own (independent) probabilities.
+# The joint scenario k = i*len(imProb) + j is wind scenario i with imbalance ratio scenario j.
+FactoredTree = collections.namedtuple('FactoredTree', ['wind', 'windProb', 'imPos', 'imNeg', 'imProb'])
 
 def createDataDirectory(topDir, dirName):
     dir = topDir + dirName
@@ -14,45 +19,170 @@ def createDataDirectory(topDir, dirName):
 
     return dir+'/'
 
-def generateScenarioTree(topDir, dirName):
+def writeScenarioChunks(chunks, fileName):
+    # Appends blocks of (scenarios x periods) values to one csv as they arrive; labels s1, s2, ... continue across blocks
+    numScenarios = 0
+    with open(fileName, 'w', newline='') as f:
+        for chunk in chunks:
+            index = ['s'+str(s) for s in range(numScenarios+1, numScenarios+chunk.shape[0]+1)]
+            pandas.DataFrame(data=chunk, index=index, columns=['t'+str(t) for t in range(1, chunk.shape[1]+1)]).to_csv(f, header=numScenarios == 0)
+            numScenarios += chunk.shape[0]
+
+    return numScenarios
+
+def buildFactoredTree(wind, windProb, im):
+    periods = ['t'+str(t) for t in range(1,25)]
+
+    #imbalance price ratios: positive imbalances are paid at most, negative ones charged at least, the day-ahead price
+    r = im['r'].values.astype('float64').reshape(-1,1)
+    imPos = numpy.repeat(numpy.minimum(r, 1), len(periods), axis=1)
+    imNeg = numpy.repeat(numpy.maximum(r, 1), len(periods), axis=1)
+
+    return FactoredTree(wind=wind.loc[:, periods].astype('float64'),
+                        windProb=pandas.Series(index=wind.index, data=numpy.asarray(windProb, dtype='float64')),
+                        imPos=pandas.DataFrame(index=im.index, columns=periods, data=imPos),
+                        imNeg=pandas.DataFrame(index=im.index, columns=periods, data=imNeg),
+                        imProb=pandas.Series(index=im.index, data=im['prob'].values.astype('float64')))
+
+def expandFactoredTree(tree):
+    # Full cross product of the factored tree as (wind, imPos, imNeg, probs) frames
+    periods = list(tree.wind.columns)
+    numWind, numIm = len(tree.wind.index), len(tree.imPos.index)
+    index = ['s'+str(s) for s in range(1, numWind*numIm+1)]
+
+    windNew = pandas.DataFrame(index=index, columns=periods, data=numpy.repeat(tree.wind.values, numIm, axis=0))
+    imPosNew = pandas.DataFrame(index=index, columns=periods, data=numpy.tile(tree.imPos.values, (numWind, 1)))
+    imNegNew = pandas.DataFrame(index=index, columns=periods, data=numpy.tile(tree.imNeg.values, (numWind, 1)))
+    probNew = pandas.DataFrame(index=index, columns=['prob'], data=numpy.outer(tree.windProb.values, tree.imProb.values).reshape(-1,1))
+
+    return windNew, imPosNew, imNegNew, probNew
+
+def buildScenarioTree(wind, windProb, im):
+    return expandFactoredTree(buildFactoredTree(wind, windProb, im))
+
+def scenarioDistances(values, centres=None):
+    # Euclidean distances between all rows (scenarios) of values, or between the rows of values and of centres
+    centres = values if centres is None else centres
+    squared = numpy.einsum('ij,ij->i', values, values)
+    squaredCentres = numpy.einsum('ij,ij->i', centres, centres)
+    return numpy.sqrt(numpy.maximum(squared[:,None] + squaredCentres[None,:] - 2*(values @ centres.T), 0))
+
+def nearestScenarios(values, centres, chunkSize=1000):
+    # Index of and distance to the closest centre for every row, computed in blocks of rows
+    nearest, distance = numpy.empty(values.shape[0], dtype='int64'), numpy.empty(values.shape[0])
+    for start in range(0, values.shape[0], chunkSize):
+        distances = scenarioDistances(values[start:start+chunkSize], centres)
+        nearest[start:start+chunkSize] = numpy.argmin(distances, axis=1)
+        distance[start:start+chunkSize] = distances[numpy.arange(distances.shape[0]), nearest[start:start+chunkSize]]
+
+    return nearest, distance
+
+@instrumented()
+def reduceScenarios(wind, windProb, numReduced, maxCandidates=2000):
+    # Fast forward selection (Heitsch & Roemisch) on the 24-hour power vectors: scenarios are added one at a time so that
+    # the probability (Kantorovich) distance to the full set is minimal, then every dropped scenario gives its probability
+    # to the closest kept one. Returns the kept wind scenarios, their probabilities and the distance achieved.
+    # Above maxCandidates scenarios the selection runs on that many evenly spaced candidates, each carrying the probability
+    # of the scenarios closest to it, so memory stays at maxCandidates^2; the final assignment still uses every scenario.
+    values = wind.values.astype('float64')
+    prob = numpy.asarray(windProb, dtype='float64')
+    numReduced = min(numReduced, len(wind.index))
+
+    candidates = numpy.arange(len(wind.index))
+    candidateProb = prob
+    if len(wind.index) > maxCandidates:
+        candidates = numpy.unique(numpy.linspace(0, len(wind.index)-1, maxCandidates).astype('int64'))
+        candidateProb = numpy.bincount(nearestScenarios(values, values[candidates])[0], weights=prob, minlength=candidates.shape[0])
+    distances = scenarioDistances(values[candidates])
+
+    closest = numpy.full(candidates.shape[0], numpy.inf) #distance of each candidate to the closest selected one
+    selected = []
+    for k in range(numReduced):
+        cost = candidateProb @ numpy.minimum(closest[:,None], distances)
+        cost[selected] = numpy.inf
+        selected.append(int(numpy.argmin(cost)))
+        closest = numpy.minimum(closest, distances[:, selected[-1]])
+
+    selected = candidates[selected]
+    assigned, distance = nearestScenarios(values, values[selected])
+    probReduced = numpy.bincount(assigned, weights=prob, minlength=numReduced)
+    distance = prob @ distance
+    print('Scenarios reduced from', len(wind.index), 'to', numReduced, '- probability distance: ', distance)
+
+    return wind.iloc[selected], pandas.Series(index=wind.index[selected], data=probReduced), distance
+
+def loadFactoredTree(topDir, dirName):
+    # The factored tree needs nothing beyond the wind scenarios and the imbalance ratio scenarios themselves. When
+    # generateScenarioTree reduced the wind scenarios, only the kept ones are used, with the probabilities of windProb_<dir>.csv
     dir = topDir + dirName
 
-    #imbalance prices
-    im = pandas.read_csv(topDir+'ratioScenarios_2020.csv')
-    r = im['r']
-    rExpanded = pandas.DataFrame(data = None, index = [s for s in range(len(im.index))], columns=['t'+str(t) for t in range(1,25)])
-    for col in rExpanded.columns:
-        rExpanded.loc[:, col] = r.loc[:].values
+    im = pandas.read_csv(topDir+'ratioScenarios_2020.csv', index_col=0)
+    wind = pandas.read_csv(dir+'/wind_'+dirName+ '.csv', index_col=0)
+    if os.path.exists(dir+'/windProb_'+dirName+'.csv'):
+        wind_prob = pandas.read_csv(dir+'/windProb_'+dirName+'.csv', index_col=0)['prob']
+        wind = wind.loc[wind_prob.index]
+    else:
+        wind_prob = pandas.Series(data = [1/len(wind.index) for s in range(len(wind.index))], index = wind.index)
 
-    imPos, imNeg = rExpanded.copy(), rExpanded.copy()
-    imPos.iloc[rExpanded.loc[:,:] > 1] = 1
-    imNeg.iloc[rExpanded.loc[:,:] < 1] = 1
+    return buildFactoredTree(wind, wind_prob, im)
 
-    imbalance_prob = im['prob']
+@instrumented()
+def generateScenarioTree(topDir, dirName, outputFormat='npz', numReduced=None):
+    # numReduced: keep only that many wind scenarios (see reduceScenarios) before building the tree
+    dir = topDir + dirName
+
+    #imbalance prices
+    im = pandas.read_csv(topDir+'ratioScenarios_2020.csv')
 
     #Wind
-    wind = pandas.read_csv(dir+'/wind_'+dirName+ '.csv')
+    wind = pandas.read_csv(dir+'/wind_'+dirName+ '.csv', index_col=0)
     # If wind scenarios are not equiprobable, replace the following line to load the appropriate file
     wind_prob = pandas.Series(data = [1/len(wind.index) for s in range(len(wind.index))], index = wind.index)
+    if numReduced is not None:
+        wind, wind_prob, distance = reduceScenarios(wind, wind_prob, numReduced)
+        wind_prob.rename('prob').to_csv(dir+'/windProb_'+dirName+'.csv') #kept wind scenarios and their probabilities, for loadFactoredTree
+    elif os.path.exists(dir+'/windProb_'+dirName+'.csv'):
+        os.remove(dir+'/windProb_'+dirName+'.csv') #left over from an earlier reduced tree
+
+    windNew, imPosNew, imNegNew, probNew = buildScenarioTree(wind, wind_prob, im)
+    addStageFields(windScenarios=len(wind.index), scenarios=len(windNew.index))
+    saveScenarioTree(topDir, dirName, windNew, imPosNew, imNegNew, probNew, outputFormat)
+
+def saveScenarioTree(topDir, dirName, wind, imPos, imNeg, probs, outputFormat='npz'):
+    # 'npz' writes a single binary file with all arrays and labels, 'csv' the four text files, 'both' all of them
+    dir = topDir + dirName
+
+    if outputFormat not in ['npz', 'csv', 'both']:
+        print('Unknown scenario tree format!')
+        raise ValueError()
+
+    if outputFormat in ['npz', 'both']:
+        numpy.savez(dir+'/tree_'+dirName+'.npz', wind=wind.values, imPos=imPos.values, imNeg=imNeg.values, prob=probs['prob'].values,
+                    scenarios=numpy.asarray(wind.index, dtype=str), periods=numpy.asarray(wind.columns, dtype=str))
+
+    if outputFormat in ['csv', 'both']:
+        wind.to_csv(dir+'/tree_wind_'+dirName+'.csv')
+        imPos.to_csv(dir+'/tree_imPos_'+dirName+'.csv')
+        imNeg.to_csv(dir+'/tree_imNeg_'+dirName+'.csv')
+        probs.to_csv(dir+'/tree_probs_'+dirName+'.csv')
+
+@instrumented()
+def loadScenarioTree(topDir, dirName):
+    # Returns wind, imPos, imNeg and probs; the binary file is preferred over the csv files when both exist
+    dir = topDir + dirName
+
+    if os.path.exists(dir+'/tree_'+dirName+'.npz'):
+        with numpy.load(dir+'/tree_'+dirName+'.npz') as data:
+            scenarios, periods = list(data['scenarios']), list(data['periods'])
+            wind = pandas.DataFrame(index=scenarios, columns=periods, data=data['wind'])
+            imPos = pandas.DataFrame(index=scenarios, columns=periods, data=data['imPos'])
+            imNeg = pandas.DataFrame(index=scenarios, columns=periods, data=data['imNeg'])
+            probs = pandas.DataFrame(index=scenarios, columns=['prob'], data=data['prob'].reshape(-1,1))
+
+    else:
+        wind = pandas.read_csv(dir+'/tree_wind_'+dirName+'.csv', index_col=0)
+        imPos = pandas.read_csv(dir+'/tree_imPos_'+dirName+'.csv', index_col=0)
+        imNeg = pandas.read_csv(dir+'/tree_imNeg_'+dirName+'.csv', index_col=0)
+        probs = pandas.read_csv(dir+'/tree_probs_'+dirName+'.csv', index_col=0)
 
-    numScen = len(im.index) * len(wind.index)
-
-    windNew = pandas.DataFrame(data=None, index=['s'+str(s) for s in range(1,numScen+1)], columns=['t'+str(t) for t in range(1,25)])
-    imPosNew = pandas.DataFrame(data=None, index=['s'+str(s) for s in range(1,numScen+1)], columns=['t'+str(t) for t in range(1,25)])
-    imNegNew = pandas.DataFrame(data=None, index=['s' + str(s) for s in range(1, numScen + 1)], columns=['t' + str(t) for t in range(1, 25)])
-    probNew = pandas.DataFrame(data=None, index=['s' + str(s) for s in range(1, numScen + 1)], columns=['prob'])
-
-    k = 0
-    for i in range(len(wind.index)):
-        for j in range(len(im.index)):
-            #print(k, i,j)
-            windNew.iloc[k, :] = wind.iloc[i,:]
-            imPosNew.iloc[k, :] = imPos.iloc[j,:]
-            imNegNew.iloc[k, :] = imNeg.iloc[j,:]
-            probNew.loc['s'+str(k+1),'prob'] = (imbalance_prob.iloc[j] * wind_prob.iloc[i])
-            k = k + 1
-
-    windNew.to_csv(dir+'/tree_wind_'+dirName+'.csv')
-    imPosNew.to_csv(dir+'/tree_imPos_'+dirName+'.csv')
-    imNegNew.to_csv(dir+'/tree_imNeg_'+dirName+'.csv')
-    probNew.to_csv(dir+'/tree_probs_'+dirName+'.csv')
\ No newline at end of file
+    return wind, imPos, imNeg, probs
@@ -0,0 +1,84 @@
+import time, pandas, numpy
+from scipy.optimize import linprog
+from .recourseUtils import scenarioProfits, profitGradients, cvarWeights
+from .stochasticProgrammingModel import profitDistribution
+
+# L-shaped (Benders) version of stochasticRisk. The second stage has a closed form (see recourseUtils), and for a given
+# bid the best zeta is the VaR, so the objective (1-beta)*EP + beta*CVaR is a concave function of the 24 bids only.
+# The master LP keeps one cut per period for the expected profit (it is separable over the periods) and one aggregated
+# cut for the CVaR; every iteration evaluates all scenarios in chunks, so memory does not grow with the LP.
+
+def evaluateRisk(bid, price, wind, dplus, dminus, prob, alpha, beta, chunkSize=10000):
+    # Objective terms at a bid and their supergradients: EP per period, CVaR as a whole
+    profit = scenarioProfits(bid, price, wind, dplus, dminus, chunkSize)
+    weights, cvar, var = cvarWeights(profit, prob, alpha)
+
+    expected = numpy.zeros(wind.shape[1])
+    for start in range(0, wind.shape[0], chunkSize):
+        chunk = slice(start, start+chunkSize)
+        delta = wind[chunk] - bid
+        expected += prob[chunk] @ (bid + dplus[chunk]*numpy.maximum(delta, 0) - dminus[chunk]*numpy.maximum(-delta, 0))
+
+    return {'profit': profit, 'hourlyEP': expected*price, 'hourlyGradient': profitGradients(bid, price, wind, dplus, dminus, prob, chunkSize),
+            'CVaR': cvar, 'VaR': var, 'cvarGradient': profitGradients(bid, price, wind, dplus, dminus, weights, chunkSize),
+            'objective': (1-beta)*(expected @ price) + beta*cvar}
+
+def solveRiskDecomposition(price, wind, dplus, dminus, prob, alpha, beta, Pcap=25, tol=1e-7, maxIterations=1000, chunkSize=10000):
+    # Kelley cutting planes on x = (P_DA (T) | theta_t (T) | theta_cvar); the master maximizes (1-beta)*sum(theta_t) + beta*theta_cvar
+    numT = wind.shape[1]
+    c = -numpy.concatenate([numpy.zeros(numT), numpy.full(numT, 1-beta), [beta]])
+    bounds = [(0, Pcap)]*numT + [(None, None)]*(numT+1)
+    rows, rhs = [], []
+
+    bid = (prob @ wind) / prob.sum() #expected wind as a first guess
+    best, bestBid, upper = None, None, numpy.inf
+    for iteration in range(1, maxIterations+1):
+        point = evaluateRisk(bid, price, wind, dplus, dminus, prob, alpha, beta, chunkSize)
+        if best is None or point['objective'] > best['objective']:
+            best, bestBid = point, bid
+
+        if upper - best['objective'] <= tol*max(1, abs(best['objective'])):
+            break
+
+        #theta_t <= EP_t(bid) + g_t*(P_DA_t - bid_t) and theta_cvar <= CVaR(bid) + g'(P_DA - bid)
+        hourly = numpy.zeros((numT, 2*numT+1))
+        hourly[numpy.arange(numT), numpy.arange(numT)] = -point['hourlyGradient']
+        hourly[numpy.arange(numT), numT+numpy.arange(numT)] = 1
+        rows.append(hourly)
+        rhs.append(point['hourlyEP'] - point['hourlyGradient']*bid)
+
+        tail = numpy.zeros((1, 2*numT+1))
+        tail[0, :numT], tail[0, -1] = -point['cvarGradient'], 1
+        rows.append(tail)
+        rhs.append([point['CVaR'] - point['cvarGradient'] @ bid])
+
+        master = linprog(c, A_ub=numpy.vstack(rows), b_ub=numpy.concatenate(rhs), bounds=bounds, method='highs')
+        if master.x is None:
+            print('Optimization failed: ', master.message)
+            raise ValueError()
+        bid, upper = master.x[:numT], -master.fun
+
+    status = 'optimal' if upper - best['objective'] <= tol*max(1, abs(best['objective'])) else 'iteration_limit'
+    return bestBid, best, {'status': status, 'iterations': iteration, 'gap': upper - best['objective']}
+
+def stochasticRiskDecomposition(DApriceFC, WGScen, IMplus, IMminus, probs, alpha, beta, tol=1e-7, maxIterations=1000, chunkSize=10000):
+    # Same inputs and resList as stochasticRisk; 'iterations' in the solve info counts the Benders iterations
+    periods, scenarios = list(DApriceFC.index), list(WGScen.index)
+    price = DApriceFC['DAP'].values.astype('float64')
+    wind = WGScen.loc[:, periods].values.astype('float64')
+    dplus, dminus = IMplus.loc[scenarios, periods].values.astype('float64'), IMminus.loc[scenarios, periods].values.astype('float64')
+    prob = probs.loc[scenarios, 'prob'].values.astype('float64')
+
+    start = time.perf_counter()
+    bid, point, info = solveRiskDecomposition(price, wind, dplus, dminus, prob, alpha, beta, tol=tol, maxIterations=maxIterations, chunkSize=chunkSize)
+    solveTime = time.perf_counter() - start
+
+    mainResults = pandas.Series(index=['alpha', 'beta', 'expected_profit', 'CVaR', 'VaR'], data=[alpha, beta, prob @ point['profit'], point['CVaR'], point['VaR']], dtype='float64')
+    solveInfo = pandas.Series({'status': info['status'], 'solve_time': solveTime, 'iterations': info['iterations']})
+    probs = pandas.Series(index=scenarios, data=prob, name='prob')
+    imbalance = (wind - bid).T
+
+    resList = [mainResults, pandas.Series(index=periods, data=bid), profitDistribution(scenarios, point['profit'], prob),
+               pandas.DataFrame(index=periods, columns=scenarios, data=imbalance), pandas.Series(index=periods, data=imbalance @ prob), probs, solveInfo]
+
+    return info, resList
@@ -0,0 +1,122 @@
+import time, pandas, numpy
+from scipy import sparse
+from scipy.optimize import linprog
+from .stochasticProgrammingModel import profitDistribution
+
+# The CVaR model of stochasticRisk assembled directly as sparse matrices (minimize c'x s.t. A_ub x <= b_ub, A_eq x == b_eq).
+# Columns: P_DA (T) | Delta_plus (W x T) | Delta_minus (W x T) | zeta | eta (S). The definitional variables of the Pyomo
+# model (Delta, EP, cvar, scenario_cost, EIm_hourly) are not needed by the solver and are computed from the solution.
+# Scenario s uses wind row windOfScenario[s]: one row per scenario gives the extensive form, a shared row the factored one.
+
+def buildRiskLP(price, wind, dplus, dminus, prob, alpha, beta, windOfScenario=None, Pcap=25):
+    price, wind = numpy.asarray(price, dtype='float64'), numpy.asarray(wind, dtype='float64')
+    dplus, dminus, prob = numpy.asarray(dplus, dtype='float64'), numpy.asarray(dminus, dtype='float64'), numpy.asarray(prob, dtype='float64')
+    numW, numT = wind.shape
+    numS = prob.shape[0]
+    if windOfScenario is None:
+        windOfScenario = numpy.arange(numS)
+
+    colP = numpy.arange(numT)
+    colPlus = numT + numpy.arange(numW*numT).reshape(numW, numT)
+    colMinus = numT + numW*numT + numpy.arange(numW*numT).reshape(numW, numT)
+    colZeta = numT + 2*numW*numT
+    colEta = colZeta + 1 + numpy.arange(numS)
+    numVars = colZeta + 1 + numS
+
+    #Objective: (1-beta)*EP + beta*CVaR, maximized
+    plusWeight, minusWeight = numpy.zeros((numW, numT)), numpy.zeros((numW, numT))
+    numpy.add.at(plusWeight, windOfScenario, prob.reshape(-1,1) * dplus)
+    numpy.add.at(minusWeight, windOfScenario, prob.reshape(-1,1) * dminus)
+
+    c = numpy.zeros(numVars)
+    c[colP] = (1-beta) * price * prob.sum()
+    c[colPlus] = (1-beta) * price * plusWeight
+    c[colMinus] = -(1-beta) * price * minusWeight
+    c[colZeta] = beta
+    c[colEta] = -beta * prob / (1-alpha)
+
+    #Imbalance balance per wind row and period: P_DA + Delta_plus - Delta_minus = P_W_DA
+    rows = numpy.arange(numW*numT)
+    A_eq = sparse.csr_matrix((numpy.concatenate([numpy.ones(2*numW*numT), -numpy.ones(numW*numT)]), (numpy.concatenate([rows, rows, rows]), numpy.concatenate([numpy.tile(colP, numW), colPlus.ravel(), colMinus.ravel()]))), shape=(numW*numT, numVars))
+    b_eq = wind.ravel()
+
+    #CVaR per scenario: zeta - eta - profit <= 0
+    rows = numpy.repeat(numpy.arange(numS), numT)
+    A_ub = sparse.csr_matrix((numpy.concatenate([numpy.tile(-price, numS), (-price*dplus).ravel(), (price*dminus).ravel(), numpy.ones(numS), -numpy.ones(numS)]),
+                              (numpy.concatenate([rows, rows, rows, numpy.arange(numS), numpy.arange(numS)]),
+                               numpy.concatenate([numpy.tile(colP, numS), colPlus[windOfScenario].ravel(), colMinus[windOfScenario].ravel(), numpy.full(numS, colZeta), colEta]))),
+                             shape=(numS, numVars))
+    b_ub = numpy.zeros(numS)
+
+    lower, upper = numpy.zeros(numVars), numpy.full(numVars, numpy.inf)
+    upper[colP] = Pcap
+    upper[colPlus] = wind
+    upper[colMinus] = Pcap
+    lower[colZeta] = -numpy.inf
+
+    return {'c': -c, 'A_ub': A_ub, 'b_ub': b_ub, 'A_eq': A_eq, 'b_eq': b_eq, 'bounds': numpy.column_stack([lower, upper]),
+            'price': price, 'wind': wind, 'dplus': dplus, 'dminus': dminus, 'prob': prob, 'windOfScenario': windOfScenario,
+            'alpha': alpha, 'beta': beta, 'colP': colP, 'colPlus': colPlus, 'colMinus': colMinus, 'colZeta': colZeta, 'colEta': colEta}
+
+def solveRiskLP(lp):
+    start = time.perf_counter()
+    result = linprog(lp['c'], A_ub=lp['A_ub'], b_ub=lp['b_ub'], A_eq=lp['A_eq'], b_eq=lp['b_eq'], bounds=lp['bounds'], method='highs')
+    result.solve_time = time.perf_counter() - start
+    if result.x is None:
+        print('Optimization failed: ', result.message)
+        raise ValueError()
+
+    return result.x, result
+
+def riskResults(lp, x, periods, scenarios, windLabels):
+    # Same resList layout as stochasticRisk; imbalance volumes are reported per wind row
+    bid = x[lp['colP']]
+    deltaPlus, deltaMinus = x[lp['colPlus']], x[lp['colMinus']]
+    zeta, eta, prob = x[lp['colZeta']], x[lp['colEta']], lp['prob']
+    windOfScenario = lp['windOfScenario']
+
+    profit = lp['price'] @ bid + ((lp['dplus']*deltaPlus[windOfScenario] - lp['dminus']*deltaMinus[windOfScenario]) @ lp['price'])
+    expectedProfit = prob @ profit
+    cvar = zeta - (prob @ eta)/(1-lp['alpha'])
+
+    result = lp['result']
+    mainResults = pandas.Series(index=['alpha', 'beta', 'expected_profit', 'CVaR', 'VaR'], data=[lp['alpha'], lp['beta'], expectedProfit, cvar, zeta], dtype='float64')
+    solveInfo = pandas.Series({'status': 'optimal' if result.status == 0 else result.message, 'solve_time': result.solve_time, 'iterations': result.nit})
+    bid = pandas.Series(index=periods, data=bid)
+
+    probs = pandas.Series(index=scenarios, data=prob, name='prob')
+    resDist = profitDistribution(scenarios, profit, prob)
+
+    imbalance = (deltaPlus - deltaMinus).T
+    imbalanceVolume = pandas.DataFrame(index=periods, columns=windLabels, data=imbalance)
+
+    windProb = numpy.bincount(windOfScenario, weights=prob, minlength=imbalance.shape[1])
+    hourlyExpectedImbalance = pandas.Series(index=periods, data=imbalance @ windProb)
+
+    return [mainResults, bid, resDist, imbalanceVolume, hourlyExpectedImbalance, probs, solveInfo]
+
+def stochasticRiskMatrix(DApriceFC, WGScen, IMplus, IMminus, probs, alpha, beta):
+    # Drop-in replacement of stochasticRisk (same inputs, same resList)
+    periods, scenarios = list(DApriceFC.index), list(WGScen.index)
+    lp = buildRiskLP(DApriceFC['DAP'].values, WGScen.loc[:, periods].values, IMplus.loc[scenarios, periods].values, IMminus.loc[scenarios, periods].values,
+                     probs.loc[scenarios, 'prob'].values, alpha, beta)
+
+    x, result = solveRiskLP(lp)
+    lp['result'] = result
+
+    return lp, riskResults(lp, x, periods, scenarios, scenarios)
+
+def stochasticRiskFactoredMatrix(DApriceFC, tree, alpha, beta):
+    # Matrix version of stochasticRiskFactored: scenario columns only exist once per wind scenario
+    periods = list(DApriceFC.index)
+    numW, numI = len(tree.wind.index), len(tree.imPos.index)
+    scenarios = ['s'+str(s) for s in range(1, numW*numI+1)]
+
+    lp = buildRiskLP(DApriceFC['DAP'].values, tree.wind.loc[:, periods].values,
+                     numpy.tile(tree.imPos.loc[:, periods].values, (numW, 1)), numpy.tile(tree.imNeg.loc[:, periods].values, (numW, 1)),
+                     numpy.outer(tree.windProb.values, tree.imProb.values).ravel(), alpha, beta, windOfScenario=numpy.repeat(numpy.arange(numW), numI))
+
+    x, result = solveRiskLP(lp)
+    lp['result'] = result
+
+    return lp, riskResults(lp, x, periods, scenarios, list(tree.wind.index))
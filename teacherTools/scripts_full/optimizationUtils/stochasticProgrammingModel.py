@@ -1,7 +1,41 @@
-import pandas, numpy
+import time, pandas, numpy
 from pyomo.environ import *
-
-def stochasticRisk(DApriceFC, WGScen, IMplus, IMminus, probs, alpha, beta):
+from ..instrumentationUtils_2020 import instrumented, addStageFields
+
+def solveModel(model, solver='appsi_highs', solverOptions=None):
+    # Any Pyomo solver name works ('appsi_highs', 'glpk', 'cbc', 'gurobi', ...); the default needs no license. A solver object
+    # can be passed instead of a name to keep a persistent solver between solves.
+    # Returns the Pyomo results and the solve status, wall-clock time and iteration count (NaN if the solver does not report it).
+    # The model functions return the latter as the last element of resList, apart from the numeric mainResults
+    opt = SolverFactory(solver) if isinstance(solver, str) else solver
+    for option, value in (solverOptions or {}).items():
+        opt.options[option] = value
+
+    start = time.perf_counter()
+    results = opt.solve(model)
+    solveTime = time.perf_counter() - start
+
+    iterations = numpy.nan
+    if getattr(results.solver, 'statistics', None) is not None and getattr(results.solver.statistics, 'iterations', None) is not None:
+        iterations = results.solver.statistics.iterations
+    else:
+        try: #APPSI HiGHS only exposes the counts on its (private) highspy model
+            info = opt._solver_model.getInfo()
+            iterations = info.simplex_iteration_count + max(info.ipm_iteration_count, 0)
+        except Exception:
+            pass
+
+    return results, {'status': str(results.solver.termination_condition), 'solve_time': solveTime, 'iterations': iterations}
+
+
+def profitDistribution(scenarios, profit, prob):
+    # Scenario profits sorted in ascending order with their cumulative probability (the profit CDF)
+    order = numpy.argsort(profit, kind='stable')
+    return pandas.DataFrame(index=numpy.asarray(scenarios)[order], data={'profit': profit[order], 'prob': prob[order], 'cumprob': numpy.cumsum(prob[order])})
+
+@instrumented()
+def stochasticRisk(DApriceFC, WGScen, IMplus, IMminus, probs, alpha, beta, solver='appsi_highs', solverOptions=None):
+    buildStart = time.perf_counter()
     model = ConcreteModel()
 
     #Define sets
@@ -16,8 +50,8 @@ def stochasticRisk(DApriceFC, WGScen, IMplus, IMminus, probs, alpha, beta):
     model.dminus   = Param(model.T, model.S, within=Reals, mutable=True)  # modifier negative imbalance
     model.prob     = Param(model.S, within=NonNegativeReals, initialize=probs['prob'].to_dict())  # probabilities of scenarios
 
-    model.alpha    = Param(within=NonNegativeReals, initialize=alpha)
-    model.beta     = Param(within=NonNegativeReals, initialize=beta)
+    model.alpha    = Param(within=NonNegativeReals, mutable=True, initialize=alpha)
+    model.beta     = Param(within=NonNegativeReals, mutable=True, initialize=beta)
 
     for t in model.T:
         for s in model.S:
@@ -88,44 +122,220 @@ def stochasticRisk(DApriceFC, WGScen, IMplus, IMminus, probs, alpha, beta):
     model.con_9 = Constraint(model.S, rule=scenarioCost)
     model.con_aux_1 = Constraint(model.T, rule=con_aux_1)
 
-    #Determine solver and solver options
-    opt                    = SolverFactory('gurobi')
-    opt.options['MIPgap']  = 0
-    opt.options['threads'] = 0
-
-    #Solve model
-    results                = opt.solve(model)
+    #Solve model (pure LP, so no MIP gap option is needed)
+    addStageFields(scenarios=len(model.S), build_time=time.perf_counter() - buildStart)
+    results, solveInfo = solveModel(model, solver, solverOptions)
+    addStageFields(solve_time=solveInfo['solve_time'], iterations=solveInfo['iterations'])
 
     #Extract results
     mainResults = pandas.Series(index=['alpha', 'beta', 'expected_profit', 'CVaR', 'VaR'],
-                                data=[model.alpha.value, model.beta.value, model.EP.value, model.cvar.value, model.zeta.value])
+                                data=[model.alpha.value, model.beta.value, model.EP.value, model.cvar.value, model.zeta.value], dtype='float64')
 
     bid = pandas.Series(index=model.T, data=[model.P_DA[t].value for t in model.T])
     bid.index.name = None
 
-    imbalanceVolume = pandas.DataFrame(index = model.T, columns=model.S, data=None)
-    for t in model.T:
-        for s in model.S:
-            imbalanceVolume.loc[t,s] = model.Delta[t,s].value
+    numT, numS = len(model.T), len(model.S)
+    delta = numpy.fromiter((model.Delta[t,s].value for t in model.T for s in model.S), dtype='float64', count=numT*numS).reshape(numT, numS)
+    imbalanceVolume = pandas.DataFrame(index=model.T, columns=model.S, data=delta)
+
+    profit = numpy.fromiter((model.scenario_cost[s].value for s in model.S), dtype='float64', count=numS)
+    probs = pandas.Series(index=model.S, data=numpy.fromiter((model.prob[s] for s in model.S), dtype='float64', count=numS), name='prob')
+    resDist = profitDistribution(probs.index, profit, probs.values)
+
+    hourlyExpectedImbalance = pandas.Series(index=model.T, data=numpy.fromiter((model.EIm_hourly[t].value for t in model.T), dtype='float64', count=len(model.T)))
+
+    resList = [mainResults, bid, resDist, imbalanceVolume, hourlyExpectedImbalance, probs, pandas.Series(solveInfo)]
+
+    return model, resList
 
-    resDist = pandas.DataFrame(index=model.S, columns=['profit', 'prob','cumprob'])
-    for s in model.S:
-        resDist.loc[s,'profit'] = model.scenario_cost[s].value
-        resDist.loc[s, 'prob']  = model.prob[s]
-        resDist.loc[s, 'cumprob'] = 0
 
-    probs = resDist['prob']
+@instrumented()
+def stochasticRiskFactored(DApriceFC, tree, alpha, beta, solver='appsi_highs', solverOptions=None):
+    # Same problem as stochasticRisk on a factored tree (see generalUtils_2020.FactoredTree). Imbalance volumes only depend
+    # on the wind scenario, so they are defined per wind scenario; joint (wind, imbalance) scenarios only appear in the
+    # CVaR constraints, which use aggregated revenues when the imbalance ratios do not change over the day.
+    buildStart = time.perf_counter()
+    model = ConcreteModel()
+
+    #Define sets
+    model.T = Set(ordered=True, initialize= DApriceFC.index)
+    model.W = Set(ordered=True, initialize= tree.wind.index)
+    model.I = Set(ordered=True, initialize= tree.imPos.index)
+
+    #Define and initialize parameters
+    model.Pcap     = Param(within=NonNegativeReals, initialize= 25) #wind-farm installed capacity in MW !!! DO NOT CHANGE!
+    model.P_W_DA   = Param(model.T, model.W, within=NonNegativeReals, initialize=tree.wind.T.stack().to_dict()) #wind power scenarios in MW
+    model.Price_DA = Param(model.T, within=NonNegativeReals, mutable=True, initialize=DApriceFC['DAP'].to_dict()) #day-ahead market price in Euros/MWh
+    model.dplus    = Param(model.T, model.I, within=Reals, initialize=tree.imPos.T.stack().to_dict())  # modifier positive imbalance
+    model.dminus   = Param(model.T, model.I, within=Reals, initialize=tree.imNeg.T.stack().to_dict())  # modifier negative imbalance
+    model.probW    = Param(model.W, within=NonNegativeReals, initialize=tree.windProb.to_dict())  # probabilities of wind scenarios
+    model.probI    = Param(model.I, within=NonNegativeReals, initialize=tree.imProb.to_dict())  # probabilities of imbalance scenarios
 
-    resDist.sort_values(by='profit', axis=0, ascending=True, inplace=True)
-    for s_in, s in enumerate(resDist.index):
-        if s_in > 0:
-            resDist.loc[s, 'cumprob'] = resDist.loc[resDist.index[s_in-1], 'cumprob'] + resDist.loc[s, 'prob']
-        else:
-            resDist.loc[s, 'cumprob'] = resDist.loc[s, 'prob']
+    model.alpha    = Param(within=NonNegativeReals, mutable=True, initialize=alpha)
+    model.beta     = Param(within=NonNegativeReals, mutable=True, initialize=beta)
+
+    constantRatios = (tree.imPos.values == tree.imPos.values[:, :1]).all() and (tree.imNeg.values == tree.imNeg.values[:, :1]).all()
+    totalProb = tree.windProb.sum() * tree.imProb.sum()
+    expectedPlus = (tree.imPos.T * tree.imProb).sum(axis=1).to_dict() #probability-weighted modifiers over imbalance scenarios
+    expectedMinus = (tree.imNeg.T * tree.imProb).sum(axis=1).to_dict()
+
+    #Define decision variables
+    model.P_DA        = Var(model.T, within=NonNegativeReals) #offer DA (MWh)
+    model.Delta       = Var(model.T, model.W, within=Reals) #imbalance volume (MWh)
+    model.Delta_plus  = Var(model.T, model.W, within= NonNegativeReals) #positive imbalance volume (MWh)
+    model.Delta_minus = Var(model.T, model.W, within= NonNegativeReals) #negative imbalance volume (MWh)
+    model.zeta        = Var(within=Reals) #auxilliary variable (equals to VaR at optimality)
+    model.eta         = Var(model.W, model.I, within=NonNegativeReals) #auxilliary variable for CVaR calculation
+    model.cvar        = Var(within=Reals) #CVaR (Euros)
+    model.EP          = Var(within=Reals) #Expected profit (Euros)
+    model.EIm_hourly  = Var(model.T, within=Reals)
+    model.DA_revenue  = Var(within=Reals) #day-ahead revenue (Euros)
+    model.plus_value  = Var(model.W, within=Reals) #positive imbalance volume valued at day-ahead prices (Euros)
+    model.minus_value = Var(model.W, within=Reals) #negative imbalance volume valued at day-ahead prices (Euros)
+
+    #Define problem objective and constraints
+    def obj(model):
+        return  (1-model.beta)*model.EP + model.beta*model.cvar
+
+    def con_DA(model):
+        return model.DA_revenue == sum(model.Price_DA[t]*model.P_DA[t] for t in model.T)
+
+    def con_plus(model, w):
+        return model.plus_value[w] == sum(model.Price_DA[t]*model.Delta_plus[t,w] for t in model.T)
+
+    def con_minus(model, w):
+        return model.minus_value[w] == sum(model.Price_DA[t]*model.Delta_minus[t,w] for t in model.T)
+
+    def con_EP(model): #not an actual constraint, it defines expected profit
+        return model.EP == totalProb*model.DA_revenue + sum(model.probW[w] * sum(model.Price_DA[t]*expectedPlus[t]*model.Delta_plus[t,w] - model.Price_DA[t]*expectedMinus[t]*model.Delta_minus[t,w] for t in model.T) for w in model.W)
 
-    hourlyExpectedImbalance = pandas.Series(index=model.T, data=[model.EIm_hourly[t].value for t in model.T])
+    def scenarioProfit(model, w, i):
+        if constantRatios:
+            t = model.T.first()
+            return model.DA_revenue + model.dplus[t,i]*model.plus_value[w] - model.dminus[t,i]*model.minus_value[w]
 
-    resList = [mainResults, bid, resDist, imbalanceVolume, hourlyExpectedImbalance, probs]
+        return model.DA_revenue + sum(model.Price_DA[t]*model.dplus[t,i]*model.Delta_plus[t,w] - model.Price_DA[t]*model.dminus[t,i]*model.Delta_minus[t,w] for t in model.T)
+
+    def con_cvar1(model, w, i):
+        return - scenarioProfit(model, w, i) + model.zeta - model.eta[w,i] <= 0
+
+    def con_cvar2(model): #Definition of CVaR
+        return model.cvar == model.zeta - (1/(1-model.alpha))*sum(model.probW[w]*model.probI[i]*model.eta[w,i] for w in model.W for i in model.I)
+
+    def con1(model, t, w):
+        return model.P_DA[t] <= model.Pcap
+
+    def con2(model, t, w):
+        return model.Delta[t,w] == model.P_W_DA[t,w] - model.P_DA[t]
+
+    def con3(model, t, w):
+        return model.Delta[t,w] == model.Delta_plus[t,w] - model.Delta_minus[t,w]
+
+    def con4(model, t, w):
+        return model.Delta_plus[t,w] <= model.P_W_DA[t,w]
+
+    def con5(model, t, w):
+        return model.Delta_minus[t,w] <= model.Pcap
+
+    def con_aux_1(model,t):
+        return model.EIm_hourly[t] == sum(model.probW[w]*model.Delta[t,w] for w in model.W)
+
+    #Add objective and constraints to the model
+    model.objective = Objective(rule=obj, sense = maximize)
+    model.con_1 = Constraint(model.T, model.W, rule= con1)
+    model.con_2 = Constraint(model.T, model.W, rule= con2)
+    model.con_3 = Constraint(model.T, model.W, rule= con3)
+    model.con_4 = Constraint(model.T, model.W, rule= con4)
+    model.con_5 = Constraint(model.T, model.W, rule= con5)
+
+    model.con_6 = Constraint(model.W, model.I, rule = con_cvar1)
+    model.con_7 = Constraint(rule= con_cvar2)
+    model.con_8 = Constraint(rule= con_EP)
+
+    model.con_DA = Constraint(rule=con_DA)
+    model.con_plus = Constraint(model.W, rule=con_plus)
+    model.con_minus = Constraint(model.W, rule=con_minus)
+    model.con_aux_1 = Constraint(model.T, rule=con_aux_1)
+
+    #Solve model (pure LP, so no MIP gap option is needed)
+    addStageFields(scenarios=len(model.W)*len(model.I), build_time=time.perf_counter() - buildStart)
+    results, solveInfo = solveModel(model, solver, solverOptions)
+    addStageFields(solve_time=solveInfo['solve_time'], iterations=solveInfo['iterations'])
+
+    #Extract results
+    mainResults = pandas.Series(index=['alpha', 'beta', 'expected_profit', 'CVaR', 'VaR'],
+                                data=[model.alpha.value, model.beta.value, model.EP.value, model.cvar.value, model.zeta.value], dtype='float64')
+
+    bid = pandas.Series(index=model.T, data=[model.P_DA[t].value for t in model.T])
+    bid.index.name = None
+
+    numT, numW, numI = len(model.T), len(model.W), len(model.I)
+    price = DApriceFC['DAP'].values.astype('float64')
+    deltaPlus = numpy.fromiter((model.Delta_plus[t,w].value for t in model.T for w in model.W), dtype='float64', count=numT*numW).reshape(numT, numW)
+    deltaMinus = numpy.fromiter((model.Delta_minus[t,w].value for t in model.T for w in model.W), dtype='float64', count=numT*numW).reshape(numT, numW)
+
+    #Joint scenarios are labelled as in the expanded tree (s1 = first wind and first imbalance scenario, ...)
+    labels = ['s'+str(s) for s in range(1, numW*numI+1)]
+    profit = price @ bid.values + numpy.einsum('t,ti,tw->wi', price, tree.imPos.values.T, deltaPlus) - numpy.einsum('t,ti,tw->wi', price, tree.imNeg.values.T, deltaMinus)
+    probs = pandas.Series(index=labels, data=numpy.outer(tree.windProb.values, tree.imProb.values).ravel(), name='prob')
+
+    resDist = profitDistribution(labels, profit.ravel(), probs.values)
+
+    imbalanceVolume = pandas.DataFrame(index=model.T, columns=model.W, data=deltaPlus - deltaMinus)
+    hourlyExpectedImbalance = pandas.Series(index=model.T, data=numpy.fromiter((model.EIm_hourly[t].value for t in model.T), dtype='float64', count=len(model.T)))
+
+    resList = [mainResults, bid, resDist, imbalanceVolume, hourlyExpectedImbalance, probs, pandas.Series(solveInfo)]
 
     return model, resList
 
+
+def scenarioArrays(model):
+    # Price (periods,), wind power, imbalance modifiers (scenarios x periods) and probabilities (scenarios,) of a model
+    # returned by stochasticRisk or stochasticRiskFactored; a factored tree is expanded to its joint (wind, imbalance) scenarios
+    periods = list(model.T)
+    price = numpy.array([value(model.Price_DA[t]) for t in periods])
+    if hasattr(model, 'S'):
+        wind = numpy.array([[value(model.P_W_DA[t,s]) for t in periods] for s in model.S])
+        dplus = numpy.array([[value(model.dplus[t,s]) for t in periods] for s in model.S])
+        dminus = numpy.array([[value(model.dminus[t,s]) for t in periods] for s in model.S])
+        return price, wind, dplus, dminus, numpy.array([value(model.prob[s]) for s in model.S])
+
+    numI = len(model.I) #joint scenario k = w*numI + i, as in generalUtils_2020.expandFactoredTree
+    wind = numpy.repeat(numpy.array([[value(model.P_W_DA[t,w]) for t in periods] for w in model.W]), numI, axis=0)
+    dplus = numpy.tile(numpy.array([[value(model.dplus[t,i]) for t in periods] for i in model.I]), (len(model.W), 1))
+    dminus = numpy.tile(numpy.array([[value(model.dminus[t,i]) for t in periods] for i in model.I]), (len(model.W), 1))
+    prob = numpy.outer([value(model.probW[w]) for w in model.W], [value(model.probI[i]) for i in model.I]).ravel()
+    return price, wind, dplus, dminus, prob
+
+
+@instrumented()
+def riskFrontier(model, alphas, betas, solver='appsi_highs', solverOptions=None):
+    # Efficient frontier over all (alpha, beta) pairs of a model returned by stochasticRisk or stochasticRiskFactored.
+    # Only the mutable alpha and beta change between solves, so a persistent solver (APPSI) just updates the affected
+    # coefficients and restarts from the previous basis. Returns one row per grid point with the main results and the bids.
+    # The risk measures are recomputed from the scenario profits of the solved bid: with beta=0 (or 1) the CVaR (or the
+    # expected profit) does not enter the objective, so model.cvar, model.zeta (or model.EP) are free and meaningless.
+    from .recourseUtils import scenarioProfits, cvarWeights #recourseUtils imports this module
+    opt = SolverFactory(solver) if isinstance(solver, str) else solver
+    if hasattr(opt, 'update_config'): #the structure never changes, only the parameter values need to be pushed
+        for check in ['check_for_new_or_removed_constraints', 'check_for_new_or_removed_vars', 'check_for_new_or_removed_params',
+                      'check_for_new_objective', 'update_constraints', 'update_vars', 'update_named_expressions', 'update_objective']:
+            setattr(opt.update_config, check, False)
+    price, wind, dplus, dminus, prob = scenarioArrays(model)
+    rows = []
+
+    for alpha in alphas:
+        for beta in betas:
+            model.alpha.value, model.beta.value = alpha, beta
+            results, solveInfo = solveModel(model, opt, solverOptions)
+
+            bid = numpy.array([model.P_DA[t].value for t in model.T])
+            profit = scenarioProfits(bid, price, wind, dplus, dminus)
+            weights, cvar, var = cvarWeights(profit, prob, alpha)
+
+            row = {'alpha': alpha, 'beta': beta, 'expected_profit': profit @ prob, 'CVaR': cvar, 'VaR': var}
+            row.update(solveInfo)
+            row.update(dict(zip(model.T, bid)))
+            rows.append(row)
+
+    return pandas.DataFrame(rows)
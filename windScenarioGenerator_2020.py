@@ -4,7 +4,10 @@ from sklearn.preprocessing import *
 from sklearn.metrics import mean_squared_error
 from scripts.forecastingUtils.foreUtils_2020 import *
 from scripts.forecastingUtils.foreDisplays_2020 import *
-numpy.random.seed(10)
+from scripts.forecastingUtils.foreCache_2020 import *
+from scripts.instrumentationUtils_2020 import enableInstrumentation
+randomSeed = 10
+numpy.random.seed(randomSeed)
 
 # ---------------------------------------------------------------------------------------------
 # -- Basic settings
@@ -13,75 +16,96 @@ inputFileName = 'windSpeed_2020.csv' #Change this to the most updated file
 turbineRatedPower = 2500 # in kW
 windfarmRatedPower = 25000 #in kW
 periodsFuture, periodsPast, daysHistory, numScenarios = 144, (144*3), 30, 30
+numReduced = None #e.g. 30 with numScenarios = 1000: the tree only keeps that many representative wind scenarios
+chunkSize = 10000 #scenarios simulated, converted to power and written at a time
+parallelWorkers = 0 #>0: every chunk is simulated by that many workers, each block with its own random stream spawned from randomSeed
+parallelExecutor = 'process' #'process' uses all cores (the code below is guarded for the worker processes); 'thread' shares the
+                             #GIL: the per-period simulation loop is small numpy steps, so threads hardly scale beyond one core
 firstDateTest = '2020-02-10 00:00:00' #Change this to the date for which you need the forecast
 firstDateTrain = pandas.to_datetime(firstDateTest)-pandas.Timedelta(str(daysHistory)+'D')
 
 featureSelection = True
 plotResidualDiagnostics = False
-scenarios = numpy.zeros((numScenarios, periodsFuture)) #initialize matrix of scenarios
+instrumentation = False #True: time and peak memory of every stage appended as JSON lines to stageLog.jsonl
 
 #Input/output paths -- do not change
 inputDataDir = 'data/'
 outputDataDir = 'data/'
 outputDataDir1 = firstDateTest.split(' ')[0]
 outputFilename = 'wind_'+outputDataDir1+'.csv'
+modelCacheDir = 'data/modelCache/'
 
-# ---------------------------------------------------------------------------------------------
-# -- Data preparation
-# ---------------------------------------------------------------------------------------------
-# Load and scale data
-wspeed = pandas.read_csv(inputDataDir+inputFileName, index_col=0, parse_dates=True, dayfirst=True)['speed']
+# The pipeline only runs when the script is executed, not when process-pool workers import it (spawn start method)
+if __name__ == '__main__':
+    if instrumentation:
+        enableInstrumentation('stageLog.jsonl', run='windScenarioGenerator '+outputDataDir1)
 
-scaler = StandardScaler()
-wspeed.loc[:] = scaler.fit_transform(wspeed.values.reshape(-1,1))[:,0]
+    # ---------------------------------------------------------------------------------------------
+    # -- Data preparation
+    # ---------------------------------------------------------------------------------------------
+    # Load, scale and lag only the rows needed for the training and test windows
+    trainSet, testSet, trainIndex, testIndex, scaler = createWindowedDataSet(inputDataDir+inputFileName, firstDateTrain, firstDateTest, periodsPast, periodsFuture, value=10, unit='min')
+    trainX, trainY = splitXY(trainSet)
+    testX, testY = splitXY(testSet)
+    print('Train X: ', trainX.shape, 'Train Y: ', trainY.shape,'Test X: ', testX.shape,'Test Y: ', testY.shape)
 
-# Create datasets
-C = createDataSet(wspeed, periodsPast)
-trainSet, testSet = splitTrainTest(C, firstDateTrain=firstDateTrain, firstDateTest=firstDateTest, value=10, unit='min')
-trainX, trainY = splitXY(trainSet)
-testX, testY = splitXY(testSet)
-print('Train X: ', trainX.shape, 'Train Y: ', trainY.shape,'Test X: ', testX.shape,'Test Y: ', testY.shape)
+    # The fitting stage (feature selection and prediction model) is skipped when a cached result exists
+    cacheKey = modelCacheKey(inputDataDir+inputFileName, firstDateTrain, periodsPast, daysHistory, ('rfe_fast' if featureSelection else 'none')+'/LR', randomSeed)
+    cachedModel = loadCachedModel(modelCacheDir, cacheKey)
 
-# Feature selection
-if featureSelection:
-    print('Starting feature selection!')
-    mask = feature_selection(trainX, trainY, 'rfe')
-    trainX = trainX[:,mask]
-    print('Done feature selection! New feature matrix size: ', trainX.shape)
+    if cachedModel is None:
+        # Feature selection
+        if featureSelection:
+            print('Starting feature selection!')
+            mask = feature_selection(trainX, trainY, 'rfe_fast')
+            trainX = trainX[:,mask]
+            print('Done feature selection! New feature matrix size: ', trainX.shape)
 
-else:
-    mask = None
-    print('No feature selection is applied!')
+        else:
+            mask = None
+            print('No feature selection is applied!')
 
-# ---------------------------------------------------------------------------------------------
-# -- Prediction model
-# ---------------------------------------------------------------------------------------------
-# Generate prediction model
-model, res, stdevRes = createPredictionModel(trainX, trainY, method='LR')
-print('Residual mean: ', numpy.mean(res), 'Residual stdev: ', stdevRes)
+    # ---------------------------------------------------------------------------------------------
+    # -- Prediction model
+    # ---------------------------------------------------------------------------------------------
+    if cachedModel is None:
+        # Generate prediction model
+        model, res, stdevRes = createPredictionModel(trainX, trainY, method='LR')
+        print('Residual mean: ', numpy.mean(res), 'Residual stdev: ', stdevRes)
+        saveCachedModel(modelCacheDir, cacheKey, mask, model, scaler, stdevRes)
 
-# Plot diagnostics on residuals
-if plotResidualDiagnostics:
-    plot_fit(model.predict(trainX), trainY)
-    plot_res_autocor(res)
-    plot_res_hist(res)
-else:
-    print('No residual diagnostics are plotted!')
+        # Plot diagnostics on residuals
+        if plotResidualDiagnostics:
+            plot_fit(model.predict(trainX), trainY)
+            plot_res_autocor(res)
+            plot_res_hist(res)
+        else:
+            print('No residual diagnostics are plotted!')
 
-# Generate scenarios
-for j in range(numScenarios):
-    arrayActual, arrayPredicted = forecastForward(testSet, testX, model, scaler, periodsFuture, stdevRes, mask=mask, testY=testY, positivityRequirement=True)
+    else:
+        mask, model, scaler, stdevRes = cachedModel
+        print('Residual stdev: ', stdevRes)
 
-    arrayActual, arrayPredicted = scaler.inverse_transform(arrayActual), scaler.inverse_transform(arrayPredicted)
-    scenarios[j, :] = arrayPredicted
+    # Generate scenarios in blocks of chunkSize paths: each block is converted to hourly power and appended to the output file,
+    # so the full speed matrix is never held in memory
+    from scripts.generalUtils_2020 import *
+    outputDir = createDataDirectory(outputDataDir, outputDataDir1)
+    arrayActual = scaler.inverse_transform(numpy.ravel(testY)[:periodsFuture].reshape(-1, 1))[:, 0]
+    actualPower = powerG126(arrayActual.reshape(1,-1))
 
-plot_windSpeedScenarios(scenarios, arrayActual)
-scenariosPower = powerG126(scenarios)
-actualPower = powerG126(arrayActual.reshape(1,-1))
-plot_windPowerScenarios(scenariosPower, actualPower)
+    def scenarioPowerChunks():
+        if parallelWorkers > 0: #reproducible for a given randomSeed and chunkSize, whatever the number of workers
+            chunks = (forecastForwardParallel(testX, model, scaler, periodsFuture, stdevRes, min(chunkSize, numScenarios - start), [randomSeed, start], mask=mask, positivityRequirement=True, sampling='truncated', maxWorkers=parallelWorkers, executor=parallelExecutor)[1]
+                      for start in range(0, numScenarios, chunkSize))
+        else:
+            chunks = forecastForwardChunks(testX, model, scaler, periodsFuture, stdevRes, numScenarios, chunkSize, mask=mask, positivityRequirement=True, sampling='truncated')
+        for count, scenarios in enumerate(chunks):
+            scenarios = scaler.inverse_transform(scenarios.reshape(-1, 1)).reshape(scenarios.shape)
+            scenariosPower = powerG126(scenarios)
+            if count == 0: #only the first block is plotted
+                plot_windSpeedScenarios(scenarios, arrayActual)
+                plot_windPowerScenarios(scenariosPower, actualPower)
+            yield (scenariosPower*(windfarmRatedPower/turbineRatedPower))/1000
 
-from scripts.generalUtils_2020 import *
-outputDir = createDataDirectory(outputDataDir, outputDataDir1)
-scenariosPowerDf = pandas.DataFrame(data=(scenariosPower*(windfarmRatedPower/turbineRatedPower))/1000, index=['s'+str(s) for s in range(1, numScenarios+1)], columns=['t'+str(t) for t in range(1, 25)])
-scenariosPowerDf.to_csv(outputDir+outputFilename)
-generateScenarioTree(outputDataDir, outputDataDir1)
+    writeScenarioChunks(scenarioPowerChunks(), outputDir+outputFilename)
+    generateScenarioTree(outputDataDir, outputDataDir1, numReduced=numReduced)